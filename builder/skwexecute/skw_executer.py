@@ -19,8 +19,39 @@ import hashlib
 import re
 import yaml
 import fnmatch
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# Below this many files a process pool costs more than it saves
+PARALLEL_LOAD_MIN = 16
+
+# Bytes handed to each write() while streaming a package download
+DOWNLOAD_CHUNK = 1 << 20
+
+# Any run of characters outside the slug alphabet, whitespace and '-'
+# included, collapses to a single '-'
+_SLUG_JUNK = re.compile(r"[^a-z0-9._+]+")
+
+#------------------------------------------------------------------#
+@lru_cache(maxsize=None)
+def _slugify(s):
+    """Slug a name for script filenames; names repeat, so results are cached."""
+    s = s.strip().lower()
+    s = s.replace("/", "_").replace("\\", "_")
+    return _SLUG_JUNK.sub("-", s).strip("-") or "unnamed"
+
+#------------------------------------------------------------------#
+def _load_yaml_file(path):
+    """Parse one build_metadata YAML file."""
+    with open(path, "rb") as f:
+        return yaml.load(f, Loader=SafeLoader) or {}
 
 #------------------------------------------------------------------#
 class SKWExecuter:
@@ -67,22 +98,31 @@ class SKWExecuter:
         if not parser_dir.exists():
             sys.exit(f"ERROR: missing {parser_dir}")
 
-        for yfile in parser_dir.glob("*.yaml"):
-            with open(yfile, "r", encoding="utf-8") as f:
-                entry = yaml.safe_load(f) or {}
-                # Normalize keys to match Scripter's slugging logic
-                c_slug = self._slug(entry.get("chapter_id", ""))
-                s_slug = self._slug(entry.get("section_id", ""))
+        # Parsing is CPU-bound and independent per file. Plain path strings
+        # from one scandir, in the same directory order glob() gave; they
+        # are also cheaper to ship to the pool than Path objects.
+        with os.scandir(parser_dir) as it:
+            yaml_files = [e.path for e in it if e.name.endswith(".yaml")]
+        if len(yaml_files) < PARALLEL_LOAD_MIN:
+            entries = [_load_yaml_file(yfile) for yfile in yaml_files]
+        else:
+            with ProcessPoolExecutor() as pool:
+                entries = list(pool.map(_load_yaml_file, yaml_files, chunksize=32))
+
+        for entry in entries:
+            # Normalize keys to match Scripter's slugging logic
+            c_slug = self._slug(entry.get("chapter_id", ""))
+            s_slug = self._slug(entry.get("section_id", ""))
 
-                # Store by the IDs used in the filename
-                self.metadata_registry[(c_slug, s_slug)] = entry
+            # Store by the IDs used in the filename
+            self.metadata_registry[(c_slug, s_slug)] = entry
 
-                # Store by package name/version too (for {order}_{name}_{version}.sh)
-                n_slug = self._slug(entry.get("name", ""))
-                v_slug = self._slug(entry.get("version", ""))
-                if n_slug and v_slug and n_slug != "unnamed" and v_slug != "unnamed":
-                    # If duplicates exist, last one wins (same behavior as current dict overwrite)
-                    self.metadata_registry_pkg[(n_slug, v_slug)] = entry
+            # Store by package name/version too (for {order}_{name}_{version}.sh)
+            n_slug = self._slug(entry.get("name", ""))
+            v_slug = self._slug(entry.get("version", ""))
+            if n_slug and v_slug and n_slug != "unnamed" and v_slug != "unnamed":
+                # If duplicates exist, last one wins (same behavior as current dict overwrite)
+                self.metadata_registry_pkg[(n_slug, v_slug)] = entry
 
         # 2. IDENTIFY SCRIPTS
         self.scripts_dir = self.build_dir / book / profile / "scripter" / "scripts"
@@ -134,12 +174,7 @@ class SKWExecuter:
     #------------------------------------------------------------------#
     def _slug(self, s: str) -> str:
         """Mirror the Scripter's slugging to ensure ID keys match filenames."""
-        s = str(s).strip().lower()
-        s = s.replace("/", "_").replace("\\", "_")
-        s = re.sub(r"\s+", "-", s)
-        s = re.sub(r"[^a-z0-9._+-]+", "-", s)
-        s = re.sub(r"-{2,}", "-", s).strip("-")
-        return s or "unnamed"
+        return _slugify(str(s))
 
     #------------------------------------------------------------------#
     def parse_script_name(self, fname):
@@ -625,7 +660,7 @@ class SKWExecuter:
             with requests.get(url, stream=True) as r:
                 r.raise_for_status()
                 with open(local_tmp, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8192):
+                    for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK):
                         f.write(chunk)
             pkg_path = local_tmp
         else:
@@ -13,6 +13,32 @@ from collections import OrderedDict
 from lxml import etree
 from pathlib import Path
 
+try:
+    from yaml import CDumper as Dumper
+except ImportError:
+    from yaml import Dumper
+
+#------------------------------------------------------------------#
+class LiteralString(str):
+    """Multi-line string emitted as a YAML literal block."""
+
+#------------------------------------------------------------------#
+class SKWDumper(Dumper):
+    """
+    Package YAML dumper, on libyaml when available: LiteralString as a
+    literal block, lists always in block style.
+    """
+
+    def represent_literal(self, data):
+        # The C emitter only accepts plain str scalar values
+        return self.represent_scalar("tag:yaml.org,2002:str", str(data), style="|")
+
+    def represent_block_list(self, data):
+        return self.represent_sequence("tag:yaml.org,2002:seq", data, flow_style=False)
+
+SKWDumper.add_representer(LiteralString, SKWDumper.represent_literal)
+SKWDumper.add_representer(list, SKWDumper.represent_block_list)
+
 #------------------------------------------------------------------#
 class SKWParser:
     """
@@ -349,17 +375,6 @@ class SKWParser:
             else:
                 return obj
 
-        class LiteralString(str): pass
-
-        def literal_representer(dumper, data):
-            return dumper.represent_scalar("tag:yaml.org,2002:str", data, style="|")
-
-        def sequence_representer(dumper, data):
-            return dumper.represent_sequence("tag:yaml.org,2002:seq", data, flow_style=False)
-
-        yaml.add_representer(LiteralString, literal_representer)
-        yaml.add_representer(list, sequence_representer)
-
         def prepare_literals(obj):
             if isinstance(obj, str) and "\n" in obj:
                 return LiteralString(obj)
@@ -371,5 +386,5 @@ class SKWParser:
 
         clean_data = prepare_literals(to_dict(data))
         with filepath.open("w", encoding="utf-8") as f:
-            yaml.dump(clean_data, f, sort_keys=False, allow_unicode=True, indent=2, width=1000)
+            yaml.dump(clean_data, f, Dumper=SKWDumper, sort_keys=False, allow_unicode=True, indent=2, width=1000)
         print(f"{filename}")
@@ -7,12 +7,16 @@
 
 from __future__ import annotations
 from pathlib import Path
-import yaml
+import os
 import toml
 import json
 import argparse
 import sys
-from collections import defaultdict
+
+try:
+    from .yamlio import load_dependencies
+except ImportError:  # run as a script from this directory
+    from yamlio import load_dependencies
 
 #------------------------------------------------------------------#
 class DependencySolver:
@@ -22,13 +26,29 @@ class DependencySolver:
     """
 
     #------------------------------------------------------------------#
-    def __init__(self, target: str, yaml_dir: Path, alias_file: Path, include_classes: list[str]):
+    def __init__(self, target: str, yaml_dir: Path, alias_file: Path, include_classes: list[str],
+                 parsed: dict[Path, dict] | None = None):
         self.target = target.lower()
         self.yaml_dir = Path(yaml_dir)
         self.alias_file = Path(alias_file)
         self.include_classes = include_classes
         self.alias_map = self._load_aliases()
+        self.yaml_names, self.yaml_bases = self._index_yaml_dir()
         self.dependency_tree: dict[str, dict] = {}
+        # Parsed package YAML by path, shared by every tree this solver builds;
+        # seeded with whatever the caller has already loaded
+        self.parsed: dict[Path, dict] = dict(parsed) if parsed else {}
+        # Dependency name -> resolved package YAML (None for a blank alias)
+        self.yaml_paths: dict[str, Path | None] = {}
+        # Finished _collect_dependencies subtrees that contain no circular ref
+        self.subtree_cache: dict[str, dict] = {}
+        self.circular_refs = 0
+        # dependencies key -> build_tree group ("required_before", ...), or None
+        self.key_groups: dict[str, str | None] = {}
+        # Flat (phase, dep) edge tuple per package YAML, built once by _read_phase_edges
+        self.phase_edges: dict[Path, tuple[tuple[str, str], ...]] = {}
+        # dependencies key -> "first"/"before"/"after", or None when filtered out
+        self.key_phases: dict[str, str | None] = {}
 
     #------------------------------------------------------------------#
     def _load_aliases(self) -> dict[str, str]:
@@ -51,8 +71,42 @@ class DependencySolver:
                 print(f"[WARN] Alias for '{k}' is not a string; treating as blank.")
         return normalized
 
+    #------------------------------------------------------------------#
+    def _index_yaml_dir(self) -> tuple[set[str], dict[str, list[Path]]]:
+        """
+        Scan yaml_dir once. Returns the set of YAML file names and a map of
+        lowercase base name (stem without its last '-' part) to YAML paths,
+        with *.yaml files ahead of *.yml as the old globs returned them.
+        """
+        names = {}
+        try:
+            with os.scandir(self.yaml_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".yaml"):
+                        names[entry.name] = 0
+                    elif entry.name.endswith(".yml"):
+                        names[entry.name] = 1
+        except FileNotFoundError:
+            pass
+
+        bases: dict[str, list[Path]] = {}
+        for name in sorted(names, key=names.get):
+            stem = name.rsplit(".", 1)[0]
+            head, sep, _ = stem.rpartition("-")
+            base = head if sep else stem
+            bases.setdefault(base.lower(), []).append(self.yaml_dir / name)
+        return set(names), bases
+
     #------------------------------------------------------------------#
     def _resolve_yaml_path(self, dep: str) -> Path | None:
+        """Resolve a dependency name to its YAML, at most once per name."""
+        path = self.yaml_paths.get(dep, False)
+        if path is False:
+            path = self.yaml_paths[dep] = self._find_yaml_path(dep)
+        return path
+
+    #------------------------------------------------------------------#
+    def _find_yaml_path(self, dep: str) -> Path | None:
         dep = dep.lower().strip()
     
         # Apply depsolver alias first
@@ -65,17 +119,11 @@ class DependencySolver:
     
         # 1) Exact stem match first: <stem>.yaml / <stem>.yml
         for ext in (".yaml", ".yml"):
-            yaml_path = self.yaml_dir / f"{dep}{ext}"
-            if yaml_path.exists():
-                return yaml_path
+            if f"{dep}{ext}" in self.yaml_names:
+                return self.yaml_dir / f"{dep}{ext}"
     
-        # 2) Fallback: scan for <name>-<version>.yaml by base name
-        candidates = []
-        for f in list(self.yaml_dir.glob("*.yaml")) + list(self.yaml_dir.glob("*.yml")):
-            parts = f.stem.split("-")
-            base = "-".join(parts[:-1]) if len(parts) > 1 else f.stem
-            if base.lower() == dep:
-                candidates.append(f)
+        # 2) Fallback: look up <name>-<version>.yaml by base name
+        candidates = list(self.yaml_bases.get(dep, ()))
     
         if len(candidates) > 1:
             def version_key(path: Path):
@@ -98,56 +146,87 @@ class DependencySolver:
 
     #------------------------------------------------------------------#
     def _parse_yaml(self, yaml_path: Path) -> dict:
-        with open(yaml_path, "r") as f:
-            return yaml.safe_load(f) or {}
+        """Parse a package YAML at most once per solver, across all targets."""
+        data = self.parsed.get(yaml_path)
+        if data is None:
+            data = self.parsed[yaml_path] = self._load_yaml(yaml_path)
+        return data
+
+    #------------------------------------------------------------------#
+    def _load_yaml(self, yaml_path: Path) -> dict:
+        """Load a package YAML; only its dependencies block is built."""
+        with open(yaml_path, "rb") as f:
+            return load_dependencies(f) or {}
 
     #------------------------------------------------------------------#
     def _normalize_names(self, entry: dict) -> list[str]:
-        """Normalize dependency entries to lowercase list."""
+        """Normalize dependency entries to a lowercase list of interned names."""
         if not entry or entry == "" or entry == {"name": ""}:
             return []
         names = entry.get("name", [])
         if isinstance(names, str):
-            return [names.lower()]
-        return [n.lower() for n in names if n]
+            return [sys.intern(names.lower())]
+        return [sys.intern(n.lower()) for n in names if n]
 
     #------------------------------------------------------------------#
-    def _collect_dependencies(self, package: str, visited: set[str] | None = None, stack: list[str] | None = None) -> dict:
+    def _collect_dependencies(self, package: str, visited: set[str] | None = None, stack: set[str] | None = None) -> dict:
         if visited is None:
             visited = set()
         if stack is None:
-            stack = []
+            stack = set()
         package = package.lower()
 
+        cached = self.subtree_cache.get(package)
+        if cached is not None:
+            return cached
+
         if package in stack:
+            self.circular_refs += 1
             return {"_circular_ref": package}
-
-        stack.append(package)
-
-        yaml_path = self._resolve_yaml_path(package)
-        if yaml_path is None:
-            stack.pop()
-            return {"_warn": f"Skipped due to blank alias for {package}"}
-
-        pkg_data = self._parse_yaml(yaml_path)
-        deps = pkg_data.get("dependencies", {})
-        result = {}
-
-        for key, value in deps.items():
-            prefix = key.split("_", 1)[0]
-            if prefix not in self.include_classes:
-                continue
-            dep_list = self._normalize_names(value)
-            if dep_list:
-                phase = key.split("_", 1)[1] if "_" in key else "unspecified"
-                result[f"{prefix}_{phase}"] = {}
-                for dep in dep_list:
-                    result[f"{prefix}_{phase}"][dep] = self._collect_dependencies(dep, visited, stack.copy())
-
-        stack.pop()
+        circular_before = self.circular_refs
+
+        # One ancestor set is shared down the recursion; every add is
+        # paired with a discard so children see exactly their ancestors.
+        stack.add(package)
+        try:
+            yaml_path = self._resolve_yaml_path(package)
+            if yaml_path is None:
+                return {"_warn": f"Skipped due to blank alias for {package}"}
+
+            pkg_data = self._parse_yaml(yaml_path)
+            deps = pkg_data.get("dependencies", {})
+            result = {}
+
+            key_groups = self.key_groups
+            for key, value in deps.items():
+                group = key_groups.get(key, False)
+                if group is False:
+                    group = key_groups[key] = self._group_for_key(key)
+                if group is None:
+                    continue
+                dep_list = self._normalize_names(value)
+                if dep_list:
+                    children = result[group] = {}
+                    for dep in dep_list:
+                        children[dep] = self._collect_dependencies(dep, visited, stack)
+        finally:
+            stack.discard(package)
+
+        # A subtree that hit no circular ref does not depend on its
+        # ancestors, so later parents can reuse it as-is.
+        if self.circular_refs == circular_before:
+            self.subtree_cache[package] = result
         visited.add(package)
         return result
 
+    #------------------------------------------------------------------#
+    def _group_for_key(self, key: str) -> str | None:
+        """Map a dependencies key to its build_tree group, or None if it is not included."""
+        prefix, sep, phase = key.partition("_")
+        if prefix not in self.include_classes:
+            return None
+        return f"{prefix}_{phase if sep else 'unspecified'}"
+
     #------------------------------------------------------------------#
     def build_tree(self) -> dict:
         print(f"[INFO] Building dependency tree for target: {self.target}")
@@ -159,20 +238,17 @@ class DependencySolver:
         print(json.dumps(self.dependency_tree, indent=2))
 
     #------------------------------------------------------------------#
-    def _expand_phase_tree(self, pkg: str, visited=None):
-        if visited is None:
-            visited = set()
+    def _phase_node(self, pkg: str, visited: set[str]) -> tuple[dict, tuple[tuple[str, str], ...]]:
+        """Build one 5-phase node and return it with its pending (phase, dep) edges."""
         pkg = pkg.lower()
         if pkg in visited:
-            return {f"target_{pkg}": pkg, "_circular_ref": pkg}
+            return {f"target_{pkg}": pkg, "_circular_ref": pkg}, ()
 
         visited.add(pkg)
         yaml_path = self._resolve_yaml_path(pkg)
         if not yaml_path:
-            return {f"target_{pkg}": pkg, "_warn": f"No YAML found for {pkg}"}
+            return {f"target_{pkg}": pkg, "_warn": f"No YAML found for {pkg}"}, ()
 
-        data = self._parse_yaml(yaml_path)
-        deps = data.get("dependencies", {})
         tree = {
             f"bootstrap1_{pkg}": [],
             f"before_{pkg}": {},
@@ -181,27 +257,64 @@ class DependencySolver:
             f"after_{pkg}": {},
         }
 
+        edges = self.phase_edges.get(yaml_path)
+        if edges is None:
+            edges = self.phase_edges[yaml_path] = self._read_phase_edges(yaml_path)
+        return tree, edges
+
+    #------------------------------------------------------------------#
+    def _read_phase_edges(self, yaml_path: Path) -> tuple[tuple[str, str], ...]:
+        """Flatten a package's included dependencies into (phase, dep) edges."""
+        deps = self._parse_yaml(yaml_path).get("dependencies", {})
+        edges = []
         for key, entry in deps.items():
-            prefix = key.split("_", 1)[0]
-            if prefix not in self.include_classes:
+            phase = self.key_phases.get(key, False)
+            if phase is False:
+                phase = self.key_phases[key] = self._classify_key(key)
+            if phase is not None:
+                edges.extend((phase, dep) for dep in self._normalize_names(entry))
+        return tuple(edges)
+
+    #------------------------------------------------------------------#
+    def _classify_key(self, key: str) -> str | None:
+        """Map a dependencies key to its phase, or None if it is not included."""
+        if key.split("_", 1)[0] not in self.include_classes:
+            return None
+        for phase in ("first", "before", "after"):
+            if key.endswith(f"_{phase}"):
+                return phase
+        return None
+
+    #------------------------------------------------------------------#
+    def _expand_phase_tree(self, pkg: str, visited=None):
+        """Expand the 5-phase tree depth-first using an explicit stack."""
+        if visited is None:
+            visited = set()
+        tree, edges = self._phase_node(pkg, visited)
+        stack = [(pkg.lower(), tree, iter(edges))]
+
+        while stack:
+            parent, node, pending = stack[-1]
+            edge = next(pending, None)
+            if edge is None:
+                stack.pop()
                 continue
-            dep_list = self._normalize_names(entry)
-            if key.endswith("_first"):
-                for dep in dep_list:
-                    subtree = self._expand_phase_tree(dep, visited)
-                    tree[f"bootstrap1_{pkg}"].append(subtree)
-                    tree[f"bootstrap2_{pkg}"].append(subtree)
-            elif key.endswith("_before"):
-                for dep in dep_list:
-                    tree[f"before_{pkg}"][dep] = self._expand_phase_tree(dep, visited)
-            elif key.endswith("_after"):
-                for dep in dep_list:
-                    tree[f"after_{pkg}"][dep] = self._expand_phase_tree(dep, visited)
+
+            phase, dep = edge
+            subtree, sub_edges = self._phase_node(dep, visited)
+            if phase == "first":
+                node[f"bootstrap1_{parent}"].append(subtree)
+                node[f"bootstrap2_{parent}"].append(subtree)
+            else:
+                node[f"{phase}_{parent}"][dep] = subtree
+
+            if sub_edges:
+                stack.append((dep, subtree, iter(sub_edges)))
         return tree
 
     #------------------------------------------------------------------#
-    def build_full_phase_tree(self):
-        return self._expand_phase_tree(self.target)
+    def build_full_phase_tree(self, target: str | None = None):
+        return self._expand_phase_tree(target or self.target)
 
     #------------------------------------------------------------------#
     def print_full_phase_tree(self):
@@ -226,6 +339,25 @@ class DependencySolver:
         if target_pkg is None:
             target_pkg = self.target
 
+        # Each tree node is flattened by a _flatten_node generator that yields
+        # its child nodes and receives their flattened order back. Driving the
+        # generators from an explicit stack keeps deep trees off the C stack.
+        stack = [self._flatten_node(node, built_so_far, first_seen, target_pkg)]
+        result = None
+        while stack:
+            try:
+                child = stack[-1].send(result)
+            except StopIteration as done:
+                stack.pop()
+                result = done.value
+                continue
+            stack.append(self._flatten_node(child, built_so_far, first_seen, target_pkg))
+            result = None
+        return result
+
+    #------------------------------------------------------------------#
+    def _flatten_node(self, node, built_so_far, first_seen, target_pkg):
+        """Flatten one tree node; yields child nodes to be flattened first."""
         order = {
             "bootstrap_pass1": [],
             "buildtime": [],
@@ -248,7 +380,7 @@ class DependencySolver:
                             dep_key = next(iter(dep.keys()), None)
                             dep_name = dep_key.split("_", 1)[-1] if dep_key else None
                         if dep_name:
-                            sub = self.flatten_phases(dep, built_so_far, first_seen, target_pkg)
+                            sub = yield dep
                             order["bootstrap_pass1"].extend(sub["bootstrap_pass1"])
                             order["bootstrap_pass1"].extend(sub["buildtime"])
                             if dep_name not in first_seen:
@@ -273,7 +405,7 @@ class DependencySolver:
                 for dep, subnode in value.items():
                     if dep not in built_so_far:
                         built_so_far.add(dep)
-                        sub = self.flatten_phases(subnode, built_so_far, first_seen, target_pkg)
+                        sub = yield subnode
                         for k in order:
                             order[k].extend(sub[k])
                         order["buildtime"].append(dep)
@@ -293,15 +425,14 @@ class DependencySolver:
                 for dep, subnode in value.items():
                     if dep not in built_so_far:
                         built_so_far.add(dep)
-                        sub = self.flatten_phases(subnode, built_so_far, first_seen, target_pkg)
+                        sub = yield subnode
                         for k in order:
                             order[k].extend(sub[k])
                         order["runtime"].append(dep)
 
-        # Deduplicate within each phase
+        # Deduplicate within each phase (first occurrence wins)
         for k in order:
-            seen = set()
-            order[k] = [x for x in order[k] if x not in seen and not seen.add(x)]
+            order[k] = list(dict.fromkeys(order[k]))
 
         # Remove buildtime packages that are rebuilt in bootstrap2
         order["buildtime"] = [p for p in order["buildtime"] if p not in bootstrap2_set]
@@ -314,11 +445,11 @@ class DependencySolver:
         order["bootstrap_pass2"] = [p for p in order["bootstrap_pass2"] if p != target_pkg]
 
         # Deduplicate runtime vs earlier phases + target
-        earlier_phases = set(
-            order["bootstrap_pass1"]
-            + order["buildtime"]
-            + order["bootstrap_pass2"]
-            + order["target"]
+        earlier_phases = set().union(
+            order["bootstrap_pass1"],
+            order["buildtime"],
+            order["bootstrap_pass2"],
+            order["target"],
         )
         order["runtime"] = [p for p in order["runtime"] if p not in earlier_phases]
 
@@ -342,7 +473,7 @@ def main():
         tree = solver.build_full_phase_tree()
         if args.output:
             with open(args.output, "w") as f:
-                json.dump(tree, f, indent=2)
+                f.write(json.dumps(tree, indent=2))
             print(f"[INFO] Full-phase dependency tree saved to: {args.output}")
 
         if args.flat_phase_tree:
@@ -360,7 +491,7 @@ def main():
         tree = solver.build_tree()
         if args.output:
             with open(args.output, "w") as f:
-                json.dump(tree, f, indent=2)
+                f.write(json.dumps(tree, indent=2))
             print(f"[INFO] Dependency tree saved to: {args.output}")
         else:
             solver.print_tree()
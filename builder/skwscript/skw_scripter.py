@@ -11,9 +11,40 @@ import toml
 import yaml
 import re
 import shutil
-from glob import glob
+from functools import lru_cache
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from .depsolver import DependencySolver
+from .yamlio import PARALLEL_LOAD_MIN, read_stat_cache, stale_keys, write_stat_cache
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# Parsed YAML kept in the parser dir as {filename: (mtime_ns, size, data)}
+YAML_CACHE_NAME = ".packages.cache"
+
+# Any run of characters outside the slug alphabet, whitespace and '-'
+# included, collapses to a single '-'
+_SLUG_JUNK = re.compile(r"[^a-z0-9._+]+")
+
+#------------------------------------------------------------------#
+@lru_cache(maxsize=None)
+def _slugify(s):
+    """Slug a name for script filenames; names repeat, so results are cached."""
+    s = s.strip().lower()
+    s = s.replace("/", "_").replace("\\", "_")
+    return _SLUG_JUNK.sub("-", s).strip("-") or "unnamed"
+
+#------------------------------------------------------------------#
+def _load_yaml_file(path):
+    """Parse one parser-output YAML file; returns (data, error)."""
+    try:
+        with open(path, "rb") as f:
+            return yaml.load(f, Loader=SafeLoader) or {}, None
+    except Exception as e:
+        return None, e
 
 #------------------------------------------------------------------#
 class SKWScripter:
@@ -41,6 +72,12 @@ class SKWScripter:
         with open(self.template_path, "r") as f:
             self.default_template = f.read()
 
+        # Per-package template path -> file text, or None if missing
+        self.templates = {}
+
+        # Parser-output YAML path -> parsed data, filled by run()
+        self.parsed_yaml = {}
+
         # Get parser output dir
         raw_parser_dir = self.cfg.get("main", {}).get("parser_output", "UNDEFINED").format(book=self.book)
         self.parser_dir = Path(raw_parser_dir).expanduser().resolve()
@@ -63,15 +100,21 @@ class SKWScripter:
     #------------------------------------------------------------------#
     def run(self):
         parser_dir = self.parser_dir
-        yaml_files = sorted(glob(os.path.join(parser_dir, "*.yaml")) + glob(os.path.join(parser_dir, "*.yml")))
+        yaml_files = self._list_yaml_files(parser_dir)
         if not yaml_files:
             sys.exit(f"No YAML files found in {parser_dir}")
 
+        results = self._load_yaml_files(yaml_files)
+        # Handed to the dependency solver so it does not parse them again
+        self.parsed_yaml = {
+            Path(path): raw or {} for path, (raw, err) in zip(yaml_files, results) if err is None
+        }
+
         entries = []
-        for path in yaml_files:
+        for path, (raw, err) in zip(yaml_files, results):
             try:
-                with open(path, "r", encoding="utf-8") as f:
-                    raw = yaml.safe_load(f) or {}
+                if err is not None:
+                    raise err
                 normalized = self._normalize_entry(raw)
                 entries.append(normalized)
             except Exception as e:
@@ -141,14 +184,19 @@ class SKWScripter:
         else:
             sys.exit("Error: [main].target must be a string or a list of strings in skwscripter.toml")
 
-        # Build dependency trees for all targets, then union them (preserving order)
+        # Build dependency trees for all targets, then union them (preserving order).
+        # pass1 roots are collected in the same pass so each tree is solved once.
+        # One solver serves every target so parsed YAML is shared between trees.
         ordered_names: list[tuple[str, str]] = []  # (phase, pkg)
+        pass1_roots: set[str] = set()
+        solver = DependencySolver(
+            targets[0], self.parser_dir, alias_file, include_classes, parsed=self.parsed_yaml
+        )
         for target in targets:
-            solver = DependencySolver(target, self.parser_dir, alias_file, include_classes)
-            tree = solver.build_full_phase_tree()
-            flat = solver.flatten_phases(tree)
+            tree = solver.build_full_phase_tree(target)
+            flat = solver.flatten_phases(tree, target_pkg=target.lower())
 
-            pass1_roots = set(p.lower() for p in flat["bootstrap_pass2"])
+            pass1_roots.update(p.lower() for p in flat["bootstrap_pass2"])
 
             ordered_items = []
 
@@ -170,13 +218,6 @@ class SKWScripter:
             # Merge into the global list for all targets
             ordered_names += ordered_items
 
-        pass1_roots: set[str] = set()
-        for target in targets:
-            solver = DependencySolver(target, self.parser_dir, alias_file, include_classes)
-            tree = solver.build_full_phase_tree()
-            flat = solver.flatten_phases(tree)
-            pass1_roots.update(p.lower() for p in flat["bootstrap_pass2"])
-        
         # Global dedupe across ALL targets, but keep bootstrap_pass2 occurrence of pass1 roots
         seen: set[str] = set()
         deduped: list[tuple[str, str]] = []
@@ -297,7 +338,7 @@ class SKWScripter:
                 continue
             emitted.add(dedupe_key)
 
-            script_name = f"{order}_{self._slug(name)}_{self._slug(ver)}.sh"
+            script_name = f"{order}_{name_slug}_{ver_slug}.sh"
             script_path = os.path.join(script_dir, script_name)
             with open(script_path, "w", encoding="utf-8") as f:
                 f.write(script_content)
@@ -310,12 +351,7 @@ class SKWScripter:
         
     #------------------------------------------------------------------#  
     def _slug(self, s: str) -> str:
-        s = str(s).strip().lower()
-        s = s.replace("/", "_").replace("\\", "_")
-        s = re.sub(r"\s+", "-", s)
-        s = re.sub(r"[^a-z0-9._+-]+", "-", s)
-        s = re.sub(r"-{2,}", "-", s).strip("-")
-        return s or "unnamed"
+        return _slugify(str(s))
         
     #------------------------------------------------------------------#
     def _should_generate_script(self, entry):
@@ -350,6 +386,60 @@ class SKWScripter:
         return explicitly_included
 
 
+    #------------------------------------------------------------------#
+    def _list_yaml_files(self, parser_dir):
+        """
+        Sorted *.yaml and *.yml paths in parser_dir, from a single scan.
+        Dotfiles are skipped, as glob does.
+        """
+        try:
+            with os.scandir(parser_dir) as it:
+                return sorted(
+                    e.path for e in it
+                    if e.name.endswith((".yaml", ".yml")) and not e.name.startswith(".")
+                )
+        except FileNotFoundError:
+            return []
+
+    #------------------------------------------------------------------#
+    def _load_yaml_files(self, yaml_files):
+        """
+        Parse yaml_files into (data, error) pairs. Files whose mtime and size
+        match the parser-dir cache are not parsed again.
+        """
+        cache_path = os.path.join(self.parser_dir, YAML_CACHE_NAME)
+        cache = read_stat_cache(cache_path)
+        by_name = {os.path.basename(path): path for path in yaml_files}
+        stamps, stale = stale_keys(cache, by_name)
+        stale = [by_name[name] for name in stale]
+
+        # Parsing is CPU-bound and independent per file
+        if len(stale) < PARALLEL_LOAD_MIN:
+            parsed = [_load_yaml_file(path) for path in stale]
+        else:
+            with ProcessPoolExecutor() as pool:
+                parsed = list(pool.map(_load_yaml_file, stale, chunksize=32))
+        parsed = dict(zip(stale, parsed))
+
+        results = []
+        new_cache = {}
+        for path in yaml_files:
+            name = os.path.basename(path)
+            if path in parsed:
+                raw, err = parsed[path]
+                if err is None:
+                    new_cache[name] = (*stamps[name], raw)
+                results.append((raw, err))
+            else:
+                new_cache[name] = cache[name]
+                results.append((cache[name][2], None))
+
+        # Written before normalization, which edits the parsed data in place
+        if stale or new_cache.keys() != cache.keys():
+            write_stat_cache(cache_path, new_cache)
+
+        return results
+
     #------------------------------------------------------------------#
     def _normalize_entry(self, raw):
         def normalize_source_block(block):
@@ -489,13 +579,23 @@ class SKWScripter:
             if key and key in self.cfg and "template" in self.cfg[key]:
                 template_file = self.cfg[key]["template"]
                 path = os.path.join(self.profiles_dir, self.book, self.profile, template_file)
-                if os.path.exists(path):
-                    with open(path, "r") as f:
-                        return f.read()
+                # Many entries share a template; stat and read each file once
+                content = self.templates.get(path, False)
+                if content is False:
+                    content = self.templates[path] = self._read_template(path)
+                if content is not None:
+                    return content
         if template_file is not None:
             print(f"[WARNING] Script template not found for {template_file}.")
         return self.default_template
 
+    #------------------------------------------------------------------#
+    def _read_template(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return f.read()
+
             
     #------------------------------------------------------------------#
     def _generate_custom_scripts(self):
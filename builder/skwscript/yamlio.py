@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# ================================================================
+#
+# yamlio.py
+#
+# ================================================================
+
+import os
+import marshal
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# Below this many files a process pool costs more than it saves
+PARALLEL_LOAD_MIN = 16
+
+# Layout of a stat cache file; a file with any other version is ignored
+STAT_CACHE_VERSION = 1
+
+#------------------------------------------------------------------#
+def load_dependencies(stream):
+    """
+    Load only the top-level dependencies block of a package YAML, as
+    {"dependencies": ...}. The whole document is still parsed, but
+    nothing else in it is built into Python objects. A document that is
+    not a plain mapping is loaded in full.
+    """
+    loader = SafeLoader(stream)
+    try:
+        root = loader.get_single_node()
+        if not isinstance(root, yaml.MappingNode) or any(
+            key.tag == "tag:yaml.org,2002:merge" for key, _ in root.value
+        ):
+            return None if root is None else loader.construct_document(root)
+        data = {}
+        for key, value in root.value:
+            if key.tag == "tag:yaml.org,2002:str" and key.value == "dependencies":
+                data["dependencies"] = loader.construct_document(value)
+        return data
+    finally:
+        loader.dispose()
+
+#------------------------------------------------------------------#
+def read_stat_cache(cache_path):
+    """
+    Load a cache written by write_stat_cache as {key: (mtime_ns, size, data)}.
+    The file is read with marshal, which only rebuilds plain data and never
+    runs code. A missing, unreadable or other-version file reads as empty
+    and malformed entries are dropped, so callers simply parse again.
+    """
+    try:
+        with open(cache_path, "rb") as f:
+            blob = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return {}
+
+    if not isinstance(blob, dict) or blob.get("version") != STAT_CACHE_VERSION:
+        return {}
+    entries = blob.get("entries")
+    if not isinstance(entries, dict):
+        return {}
+    return {k: v for k, v in entries.items() if isinstance(v, tuple) and len(v) == 3}
+
+#------------------------------------------------------------------#
+def stale_keys(cache, files):
+    """
+    Stat files ({key: path}) against cache. Returns each file's
+    (mtime_ns, size) by key, and the keys whose cache entry is missing
+    or carries a different stamp.
+    """
+    stamps = {}
+    stale = []
+    for key, path in files.items():
+        st = os.stat(path)
+        stamp = stamps[key] = (st.st_mtime_ns, st.st_size)
+        hit = cache.get(key)
+        if hit is None or hit[:2] != stamp:
+            stale.append(key)
+    return stamps, stale
+
+#------------------------------------------------------------------#
+def write_stat_cache(cache_path, entries):
+    """
+    Write entries ({key: (mtime_ns, size, data)}) through a temporary file
+    and a rename. Entries marshal cannot store (YAML timestamps, for one)
+    are left out and get parsed again next time.
+    """
+    try:
+        blob = marshal.dumps({"version": STAT_CACHE_VERSION, "entries": entries})
+    except ValueError:
+        kept = {}
+        for key, entry in entries.items():
+            try:
+                marshal.dumps(entry)
+            except ValueError:
+                continue
+            kept[key] = entry
+        blob = marshal.dumps({"version": STAT_CACHE_VERSION, "entries": kept})
+
+    tmp_path = f"{cache_path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(blob)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"[WARN] Could not write YAML cache {cache_path}: {e}")
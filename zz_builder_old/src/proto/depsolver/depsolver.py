@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 from pathlib import Path
+import os
 import yaml
 import toml
 import json
@@ -8,6 +9,11 @@ import argparse
 import sys
 from collections import defaultdict
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 
 class DependencySolver:
     """
@@ -21,7 +27,15 @@ class DependencySolver:
         self.alias_file = Path(alias_file)
         self.include_classes = include_classes
         self.alias_map = self._load_aliases()
+        self.yaml_bases = self._index_yaml_dir()
         self.dependency_tree: dict[str, dict] = {}
+        # Parsed package YAML by path; a package reached along several
+        # dependency paths is read and parsed only once
+        self.parsed: dict[Path, dict] = {}
+        # Resolved YAML path (or None) per dependency name as written
+        self.yaml_paths: dict[str, Path | None] = {}
+        # Finished _collect_dependencies subtrees that contain no circular ref
+        self.subtree_cache: dict[str, dict] = {}
 
     # ---------------------------
     # Alias & YAML loading
@@ -46,7 +60,33 @@ class DependencySolver:
                 print(f"[WARN] Alias for '{k}' is not a string; treating as blank.")
         return normalized
 
+    def _index_yaml_dir(self) -> dict[str, list[Path]]:
+        """
+        Scan yaml_dir once and map each lowercase base name (stem without
+        its last '-' part) to its *.yaml paths, in directory order.
+        """
+        bases: dict[str, list[Path]] = {}
+        try:
+            with os.scandir(self.yaml_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(".yaml"):
+                        continue
+                    stem = entry.name[:-5]
+                    head, sep, _ = stem.rpartition("-")
+                    base = head if sep else stem
+                    bases.setdefault(base.lower(), []).append(self.yaml_dir / entry.name)
+        except FileNotFoundError:
+            pass
+        return bases
+
     def _resolve_yaml_path(self, dep: str) -> Path | None:
+        """Resolve a dependency name at most once; see _find_yaml_path."""
+        path = self.yaml_paths.get(dep, False)
+        if path is False:
+            path = self.yaml_paths[dep] = self._find_yaml_path(dep)
+        return path
+
+    def _find_yaml_path(self, dep: str) -> Path | None:
         """Resolve dependency name to YAML file path.
         Alias mapping takes precedence over directory scan.
         """
@@ -64,13 +104,8 @@ class DependencySolver:
                 sys.exit(1)
             return yaml_path
 
-        # Fallback: scan YAML directory
-        candidates = []
-        for f in self.yaml_dir.glob("*.yaml"):
-            parts = f.stem.split("-")
-            base = "-".join(parts[:-1]) if len(parts) > 1 else f.stem
-            if base.lower() == dep:
-                candidates.append(f)
+        # Fallback: YAML directory index
+        candidates = list(self.yaml_bases.get(dep, ()))
 
         if len(candidates) > 1:
             # Sort numerically by version tokens and choose latest
@@ -93,8 +128,11 @@ class DependencySolver:
 
 
     def _parse_yaml(self, yaml_path: Path) -> dict:
-        with open(yaml_path, "r") as f:
-            return yaml.safe_load(f) or {}
+        data = self.parsed.get(yaml_path)
+        if data is None:
+            with open(yaml_path, "rb") as f:
+                data = self.parsed[yaml_path] = yaml.load(f, Loader=SafeLoader) or {}
+        return data
 
     def _normalize_names(self, entry: dict) -> list[str]:
         """Normalize dependency entries to lowercase list."""
@@ -109,40 +147,66 @@ class DependencySolver:
     # Strict dependency resolver
     # ---------------------------
     def _collect_dependencies(self, package: str, visited: set[str] | None = None, stack: list[str] | None = None) -> dict:
+        """
+        Iterative DFS using ENTER/EXIT frames. A single ancestor set holds the
+        current path: a node joins it on ENTER and leaves it on EXIT, so no
+        per-edge copy of the path is needed to detect circular references.
+        A subtree that hit no circular ref does not depend on its ancestors,
+        so it is cached and reused for every later parent of the package.
+        """
         if visited is None:
             visited = set()
-        if stack is None:
-            stack = []
-        package = package.lower()
-
-        if package in stack:
-            return {"_circular_ref": package}
-
-        stack.append(package)
+        ancestors = set(stack or ())
+        circular_refs = 0
+        root = {}
+        frames = [(True, package, root, "tree")]
+
+        while frames:
+            enter, package, slot, key = frames.pop()
+            if not enter:
+                # EXIT frames carry the node's result and the ref count at ENTER
+                ancestors.discard(package)
+                visited.add(package)
+                if circular_refs == key:
+                    self.subtree_cache[package] = slot
+                continue
 
-        yaml_path = self._resolve_yaml_path(package)
-        if yaml_path is None:
-            stack.pop()
-            return {"_warn": f"Skipped due to blank alias for {package}"}
+            package = package.lower()
+            cached = self.subtree_cache.get(package)
+            if cached is not None:
+                slot[key] = cached
+                continue
 
-        pkg_data = self._parse_yaml(yaml_path)
-        deps = pkg_data.get("dependencies", {})
-        result = {}
+            if package in ancestors:
+                circular_refs += 1
+                slot[key] = {"_circular_ref": package}
+                continue
 
-        for key, value in deps.items():
-            prefix = key.split("_", 1)[0]
-            if prefix not in self.include_classes:
+            yaml_path = self._resolve_yaml_path(package)
+            if yaml_path is None:
+                slot[key] = {"_warn": f"Skipped due to blank alias for {package}"}
                 continue
-            dep_list = self._normalize_names(value)
-            if dep_list:
-                phase = key.split("_", 1)[1] if "_" in key else "unspecified"
-                result[f"{prefix}_{phase}"] = {}
-                for dep in dep_list:
-                    result[f"{prefix}_{phase}"][dep] = self._collect_dependencies(dep, visited, stack.copy())
-
-        stack.pop()
-        visited.add(package)
-        return result
+
+            pkg_data = self._parse_yaml(yaml_path)
+            deps = pkg_data.get("dependencies", {})
+            result = slot[key] = {}
+            ancestors.add(package)
+            frames.append((False, package, result, circular_refs))
+
+            children = []
+            for key, value in deps.items():
+                prefix = key.split("_", 1)[0]
+                if prefix not in self.include_classes:
+                    continue
+                dep_list = self._normalize_names(value)
+                if dep_list:
+                    phase = key.split("_", 1)[1] if "_" in key else "unspecified"
+                    group = result[f"{prefix}_{phase}"] = {}
+                    children.extend((True, dep, group, dep) for dep in dep_list)
+            # Reversed so children are entered in declaration order
+            frames.extend(reversed(children))
+
+        return root["tree"]
 
     def build_tree(self) -> dict:
         print(f"[INFO] Building dependency tree for target: {self.target}")
@@ -155,17 +219,16 @@ class DependencySolver:
     # ---------------------------
     # Full-phase builder
     # ---------------------------
-    def _expand_phase_tree(self, pkg: str, visited=None):
-        if visited is None:
-            visited = set()
+    def _phase_node(self, pkg: str, visited: set[str]):
+        """Build one 5-phase node and return it with its (phase, dep) edges."""
         pkg = pkg.lower()
         if pkg in visited:
-            return {f"target_{pkg}": pkg, "_circular_ref": pkg}
+            return {f"target_{pkg}": pkg, "_circular_ref": pkg}, []
 
         visited.add(pkg)
         yaml_path = self._resolve_yaml_path(pkg)
         if not yaml_path:
-            return {f"target_{pkg}": pkg, "_warn": f"No YAML found for {pkg}"}
+            return {f"target_{pkg}": pkg, "_warn": f"No YAML found for {pkg}"}, []
 
         data = self._parse_yaml(yaml_path)
         deps = data.get("dependencies", {})
@@ -177,22 +240,41 @@ class DependencySolver:
             f"after_{pkg}": {},
         }
 
+        edges = []
         for key, entry in deps.items():
             prefix = key.split("_", 1)[0]
             if prefix not in self.include_classes:
                 continue
-            dep_list = self._normalize_names(entry)
-            if key.endswith("_first"):
-                for dep in dep_list:
-                    subtree = self._expand_phase_tree(dep, visited)
-                    tree[f"bootstrap1_{pkg}"].append(subtree)
-                    tree[f"bootstrap2_{pkg}"].append(subtree)
-            elif key.endswith("_before"):
-                for dep in dep_list:
-                    tree[f"before_{pkg}"][dep] = self._expand_phase_tree(dep, visited)
-            elif key.endswith("_after"):
-                for dep in dep_list:
-                    tree[f"after_{pkg}"][dep] = self._expand_phase_tree(dep, visited)
+            for phase in ("first", "before", "after"):
+                if key.endswith(f"_{phase}"):
+                    edges.extend((phase, dep) for dep in self._normalize_names(entry))
+                    break
+        return tree, edges
+
+    def _expand_phase_tree(self, pkg: str, visited=None):
+        """Expand the 5-phase tree depth-first using an explicit stack."""
+        if visited is None:
+            visited = set()
+        tree, edges = self._phase_node(pkg, visited)
+        stack = [(pkg.lower(), tree, iter(edges))]
+
+        while stack:
+            parent, node, pending = stack[-1]
+            edge = next(pending, None)
+            if edge is None:
+                stack.pop()
+                continue
+
+            phase, dep = edge
+            subtree, sub_edges = self._phase_node(dep, visited)
+            if phase == "first":
+                node[f"bootstrap1_{parent}"].append(subtree)
+                node[f"bootstrap2_{parent}"].append(subtree)
+            else:
+                node[f"{phase}_{parent}"][dep] = subtree
+
+            if sub_edges:
+                stack.append((dep, subtree, iter(sub_edges)))
         return tree
 
     def build_full_phase_tree(self):
@@ -222,6 +304,24 @@ class DependencySolver:
         if target_pkg is None:
             target_pkg = self.target
 
+        # Each tree node is flattened by a _flatten_node generator that yields
+        # its child nodes and receives their flattened order back. Driving the
+        # generators from an explicit stack keeps deep trees off the C stack.
+        stack = [self._flatten_node(node, built_so_far, first_seen, target_pkg)]
+        result = None
+        while stack:
+            try:
+                child = stack[-1].send(result)
+            except StopIteration as done:
+                stack.pop()
+                result = done.value
+                continue
+            stack.append(self._flatten_node(child, built_so_far, first_seen, target_pkg))
+            result = None
+        return result
+
+    def _flatten_node(self, node, built_so_far, first_seen, target_pkg):
+        """Flatten one tree node; yields child nodes to be flattened first."""
         order = {
             "bootstrap_pass1": [],
             "buildtime": [],
@@ -244,7 +344,7 @@ class DependencySolver:
                             dep_key = next(iter(dep.keys()), None)
                             dep_name = dep_key.split("_", 1)[-1] if dep_key else None
                         if dep_name:
-                            sub = self.flatten_phases(dep, built_so_far, first_seen, target_pkg)
+                            sub = yield dep
                             order["bootstrap_pass1"].extend(sub["bootstrap_pass1"])
                             order["bootstrap_pass1"].extend(sub["buildtime"])
                             if dep_name not in first_seen:
@@ -269,7 +369,7 @@ class DependencySolver:
                 for dep, subnode in value.items():
                     if dep not in built_so_far:
                         built_so_far.add(dep)
-                        sub = self.flatten_phases(subnode, built_so_far, first_seen, target_pkg)
+                        sub = yield subnode
                         for k in order:
                             order[k].extend(sub[k])
                         order["buildtime"].append(dep)
@@ -289,7 +389,7 @@ class DependencySolver:
                 for dep, subnode in value.items():
                     if dep not in built_so_far:
                         built_so_far.add(dep)
-                        sub = self.flatten_phases(subnode, built_so_far, first_seen, target_pkg)
+                        sub = yield subnode
                         for k in order:
                             order[k].extend(sub[k])
                         order["runtime"].append(dep)
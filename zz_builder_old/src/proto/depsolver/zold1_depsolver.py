@@ -7,11 +7,22 @@ using YAML package metadata and TOML alias mapping.
 """
 
 import os
+import re
 import sys
-import glob
-import yaml
 import toml
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# YAML loading is shared with the current builder (builder/skwscript)
+sys.path.append(str(Path(__file__).resolve().parents[4] / "builder"))
+from skwscript.yamlio import PARALLEL_LOAD_MIN, load_dependencies
+
+
+def _parse_yaml_file(path):
+    """Load one package YAML (module level so pool workers can run it)."""
+    with open(path, "rb") as f:
+        return load_dependencies(f)
 
 
 class DepSolver:
@@ -22,14 +33,38 @@ class DepSolver:
         "external": 4
     }
 
+    QUALIFIER_MAP = {
+        "before": "b",
+        "after": "a",
+        "first": "f",
+        "external": "b"
+    }
+
     def __init__(self, dep_dir: str, dep_level: int, package_dir: str, config_file: str):
         self.dep_dir = os.path.abspath(dep_dir)
         self.package_dir = os.path.abspath(package_dir)
         self.dep_level = int(dep_level)
+        # "<dep_dir>/": .dep paths are built as prefix + name + ".dep" and
+        # a path's node name is path[len(prefix):-4]
+        self.dep_prefix = os.path.join(self.dep_dir, "")
         os.makedirs(self.dep_dir, exist_ok=True)
 
         self.aliases = self._load_aliases(config_file)
         self.visited = set()
+        self.yaml_index = self._index_yaml_dir()
+        # Package name -> chosen YAML path; kept across generate_deps() runs
+        self.yaml_paths = {}
+        # YAML path -> parsed dependency list; aliases can send several
+        # package names to the same file
+        self.yaml_deps = {}
+        # Raw dependencies key -> (priority, qualifier_code), None if untyped,
+        # or () if its priority is beyond dep_level
+        self.key_codes = {}
+
+        # In-memory graph: .dep path -> file text. Paths in self.unwritten
+        # differ from disk until write_dep_files() flushes them.
+        self.dep_texts = {}
+        self.unwritten = set()
 
     # -------------------------------------------------------
     def _load_aliases(self, config_path: str):
@@ -39,6 +74,23 @@ class DepSolver:
         cfg = toml.load(config_path)
         return cfg.get("package_aliases", {})
 
+    # -------------------------------------------------------
+    def _index_yaml_dir(self):
+        """
+        Scan the package directory once and map each base package name
+        (file stem stripped at the last '-') to its YAML files.
+        """
+        index = {}
+        with os.scandir(self.package_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".yaml"):
+                    continue
+                name_part = entry.name[:-5]  # strip .yaml
+                if "-" not in name_part:
+                    continue
+                index.setdefault(name_part.rsplit("-", 1)[0], []).append(entry.path)
+        return index
+
     # -------------------------------------------------------
     def _resolve_package_name(self, name: str):
         """Apply alias mappings if defined."""
@@ -51,48 +103,48 @@ class DepSolver:
         Strips name at the last '-' and matches base package.
         Skips packages with blank aliases.
         """
-        pkg_alias = self._resolve_package_name(package)
+        pkg_alias, yaml_path = self._match_yaml(package)
 
         # --- NEW: skip if alias is blank ---
         if not pkg_alias.strip():
             print(f"[SKIP] Package '{package}' has a blank alias, skipping.")
             return None
 
-        candidates = glob.glob(os.path.join(self.package_dir, "*.yaml"))
-        matched_files = []
-
-        for path in candidates:
-            base = os.path.basename(path)
-            if not base.endswith(".yaml"):
-                continue
+        if yaml_path is None:
+            print(f"[ERROR] No YAML file found for package '{package}' (alias: '{pkg_alias}')")
+            sys.exit(1)
 
-            name_part = base[:-5]  # strip .yaml
-            if "-" not in name_part:
-                continue
+        return yaml_path
 
-            pkg_base = name_part.rsplit("-", 1)[0]
-            if pkg_base == pkg_alias:
-                matched_files.append(path)
+    # -------------------------------------------------------
+    def _match_yaml(self, package: str):
+        """
+        Quiet lookup behind _find_yaml_for_package: (alias, YAML path),
+        with the path None for a blank alias or when nothing matches.
+        """
+        pkg_alias = self._resolve_package_name(package)
+        if not pkg_alias.strip():
+            return pkg_alias, None
 
+        matched_files = self.yaml_index.get(pkg_alias)
         if not matched_files:
-            print(f"[ERROR] No YAML file found for package '{package}' (alias: '{pkg_alias}')")
-            sys.exit(1)
+            return pkg_alias, None
 
         # Choose lexicographically latest version if multiple found
-        matched_files.sort()
-        return matched_files[-1]
+        return pkg_alias, max(matched_files)
 
     # -------------------------------------------------------
-    def _read_yaml_deps(self, yaml_path: str):
+    def _read_yaml_deps(self, yaml_path: str, data=None):
         """
-        Parse YAML and return list of (priority, qualifier_code, dep_name).
+        Parse YAML (unless already loaded as data) and return list of
+        (priority, qualifier_code, dep_name).
         Supports structure:
           dependencies:
             required_before: { name: "glibc" }
             optional_before: { name: ["curl", "git"] }
         """
-        with open(yaml_path, "r") as f:
-            data = yaml.safe_load(f)
+        if data is None:
+            data = _parse_yaml_file(yaml_path)
 
         deps = []
         dep_data = data.get("dependencies", {})
@@ -101,8 +153,8 @@ class DepSolver:
             print(f"[ERROR] Invalid dependencies structure in {yaml_path}. Expected a mapping.")
             sys.exit(1)
 
+        key_codes = self.key_codes
         for key, obj in dep_data.items():
-            key = key.lower().strip()
             if not isinstance(obj, dict) or "name" not in obj:
                 continue
 
@@ -114,121 +166,204 @@ class DepSolver:
             if isinstance(names, str):
                 names = [names]
             elif not isinstance(names, list):
-                print(f"[WARN] Unexpected type for {key} in {yaml_path}: {type(names).__name__}")
+                print(f"[WARN] Unexpected type for {key.lower().strip()} in {yaml_path}: {type(names).__name__}")
                 continue
 
-            # Extract dependency type and qualifier
-            dep_type = None
-            qualifier = None
-            for t in ("required", "recommended", "optional", "external"):
-                if key.startswith(t):
-                    dep_type = t
-                    rest = key[len(t):].lstrip("_")
-                    qualifier = rest or "before"
-                    break
-
-            if dep_type is None:
-                print(f"[WARN] Could not determine dependency type for '{key}' in {yaml_path}")
-                continue
-
-            # Priority and qualifier code
-            priority = self.PRIORITY_MAP.get(dep_type, 1)
-            qual_map = {
-                "before": "b",
-                "after": "a",
-                "first": "f",
-                "external": "b"
-            }
-            q_code = qual_map.get(qualifier, "b")
-
-            # Special case: optional_external Ã¢â€ â€™ priority 4, qualifier b
-            if key == "optional_external":
-                priority = 4
-                q_code = "b"
-
-            # --- NEW: skip dependencies beyond dep-level ---
-            if priority > self.dep_level:
-                continue
+            # Priority and qualifier code; the same keys recur in every YAML,
+            # so each is classified and checked against dep-level once
+            codes = key_codes.get(key, False)
+            if codes is False:
+                codes = key_codes[key] = self._level_codes(key)
+            if not codes:
+                if codes is None:
+                    print(f"[WARN] Could not determine dependency type for '{key.lower().strip()}' in {yaml_path}")
+                continue  # untyped, or beyond dep-level
+            priority, q_code = codes
 
             # Write valid dependencies
             for pkg in names:
                 pkg = str(pkg).strip()
                 if not pkg:
                     continue
-                deps.append((priority, q_code, pkg))
+                deps.append((priority, q_code, sys.intern(pkg)))
 
         return deps
 
+    # -------------------------------------------------------
+    def _level_codes(self, key: str):
+        """_classify_key for a raw key, with () when it is beyond dep_level."""
+        codes = self._classify_key(key.lower().strip())
+        if codes is not None and codes[0] > self.dep_level:
+            return ()
+        return codes
+
+    # -------------------------------------------------------
+    def _classify_key(self, key: str):
+        """Map a dependencies key to (priority, qualifier_code), or None if untyped."""
+        for t, priority in self.PRIORITY_MAP.items():
+            if key.startswith(t):
+                qualifier = key[len(t):].lstrip("_") or "before"
+                break
+        else:
+            return None
+
+        # Special case: optional_external Ã¢â€ â€™ priority 4, qualifier b
+        if key == "optional_external":
+            return 4, "b"
+        return priority, self.QUALIFIER_MAP.get(qualifier, "b")
+
     # -------------------------------------------------------
     def generate_deps(self, packages: list[str]):
         """
         Step 2 Ã¢â‚¬â€ Initialize dependency graph root.
         Creates 'root.dep' with one line per target: '1 b <package>'
         """
-        dep_glob = os.path.join(self.dep_dir, "*")
-        for f in glob.glob(dep_glob):
-            if f.endswith(".dep") or f.endswith(".tree"):
-                os.remove(f)
+        with os.scandir(self.dep_dir) as it:
+            for e in it:
+                if e.name.endswith((".dep", ".tree", ".dep.tmp")) and not e.name.startswith("."):
+                    try:
+                        os.unlink(e.path)
+                    except OSError as ex:
+                        print(f"[WARN] Could not remove {e.path}: {ex}")
+        self.visited.clear()
+        self.dep_texts.clear()
+        self.unwritten.clear()
         root_path = os.path.join(self.dep_dir, "root.dep")
+        lines = [f"1 b {pkg}\n" for pkg in map(str.strip, packages) if pkg]
+        self.dep_texts[root_path] = "".join(lines)
         with open(root_path, "w") as root:
-            for pkg in packages:
-                pkg = pkg.strip()
-                if pkg:
-                    root.write(f"1 b {pkg}\n")
+            root.write(self.dep_texts[root_path])
         print(f"[OK] Created {root_path}")
         return root_path
 
     # -------------------------------------------------------
-    def generate_subgraph(self, dep_file: str, weight: int, depth: int, qualifier: str):
+    def generate_subgraph(self, dep_file: str, weight: int, depth: int, qualifier: str,
+                          flush: bool = True):
         """
-        1:1 behavioral match of the original Bash generate_subgraph() function.
-        Uses .dep file existence as state (no memory sets).
+        Iterative equivalent of the original Bash generate_subgraph() function.
+        Walks the graph breadth-first from dep_file and adds one .dep text
+        per reachable package to self.dep_texts; self.visited tracks the
+        nodes already generated. The new .dep files are written when the
+        walk ends, also when it stops on an error. With flush=False they
+        stay in memory for a later write_dep_files(), as run_pipeline does
+        so clean_subgraph() can write each file once.
         """
         dep_path = os.path.join(self.dep_dir, dep_file)
-        if not os.path.exists(dep_path):
+        if dep_path in self.dep_texts:
+            text = self.dep_texts[dep_path]
+        elif os.path.exists(dep_path):
+            with open(dep_path) as f:
+                text = self.dep_texts[dep_path] = f.read()
+        else:
             print(f"[ERROR] Missing dependency file: {dep_path}")
             sys.exit(1)
 
-        with open(dep_path) as f:
-            lines = [l.strip() for l in f if l.strip()]
+        root_lines = [l.strip() for l in text.splitlines() if l.strip()]
 
-        for line in lines:
+        edges = []
+        for line in root_lines:
             try:
                 prio, qual, pkg = line.split()
-                prio = int(prio)
+                edges.append((int(prio), qual, sys.intern(pkg)))
             except ValueError:
                 print(f"[ERROR] Invalid line in {dep_path}: '{line}'")
                 sys.exit(1)
 
-            # Match Bash DEP_LEVEL logic
-            if prio > self.dep_level:
-                print(f" Out: {pkg} (priority {prio} > {self.dep_level})")
-                continue
-
-            pkg_dep_path = os.path.join(self.dep_dir, f"{pkg}.dep")
-            if os.path.exists(pkg_dep_path):
-                print(f" Edge: {pkg}.dep already exists, skipping")
-                continue
-
-            yaml_path = self._find_yaml_for_package(pkg)
-            if yaml_path is None:
-                # Package intentionally skipped due to blank alias
-                continue
-                
-            deps = self._read_yaml_deps(yaml_path)
-
-            # Write new .dep file
-            with open(pkg_dep_path, "w") as depf:
-                for (p, q, name) in deps:
-                    depf.write(f"{p} {q} {name}\n")
+        # Level by level, in the same order as a FIFO queue. The YAML of a
+        # level's new packages is loaded up front, on a process pool when
+        # there are enough of them and more than one CPU; otherwise each
+        # file is parsed as it is reached.
+        level = [(edges, depth)]
+        pool = None
+        use_pool = (os.cpu_count() or 1) > 1
+        try:
+            while level:
+                paths = self._level_yaml_paths(level) if use_pool else ()
+                parsed = {}
+                if len(paths) >= PARALLEL_LOAD_MIN:
+                    if pool is None:
+                        pool = ProcessPoolExecutor()
+                    parsed = dict(zip(paths, pool.map(_parse_yaml_file, paths, chunksize=8)))
+
+                next_level = []
+                for edges, depth in level:
+                    for (prio, qual, pkg) in edges:
+                        # Match Bash DEP_LEVEL logic
+                        if prio > self.dep_level:
+                            print(f" Out: {pkg} (priority {prio} > {self.dep_level})")
+                            continue
+
+                        if pkg in self.visited:
+                            print(f" Edge: {pkg}.dep already exists, skipping")
+                            continue
+
+                        yaml_path = self.yaml_paths.get(pkg)
+                        if yaml_path is None:
+                            yaml_path = self._find_yaml_for_package(pkg)
+                            if yaml_path is None:
+                                # Package intentionally skipped due to blank alias
+                                continue
+                            self.yaml_paths[pkg] = yaml_path
+
+                        deps = self.yaml_deps.get(yaml_path)
+                        if deps is None:
+                            deps = self.yaml_deps[yaml_path] = self._read_yaml_deps(
+                                yaml_path, parsed.get(yaml_path)
+                            )
+
+                        # Add new .dep text
+                        pkg_dep_path = f"{self.dep_prefix}{pkg}.dep"
+                        self.dep_texts[pkg_dep_path] = "".join(f"{p} {q} {name}\n" for (p, q, name) in deps)
+                        self.unwritten.add(pkg_dep_path)
+                        self.visited.add(pkg)
+
+                        print(f" Node: {pkg} (depth {depth})")
+
+                        if not deps:
+                            print(f" Leaf: {pkg}")
+                        else:
+                            next_level.append((deps, depth + 1))
+                level = next_level
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if flush:
+                self.write_dep_files()
 
-            print(f" Node: {pkg} (depth {depth})")
+    # -------------------------------------------------------
+    def _level_yaml_paths(self, level):
+        """
+        Sorted YAML paths of the packages a BFS level will generate whose
+        dependencies are not cached yet. Skips and errors are reported
+        by the walk itself.
+        """
+        paths = set()
+        for edges, _ in level:
+            for prio, _, pkg in edges:
+                if prio > self.dep_level or pkg in self.visited:
+                    continue
+                yaml_path = self.yaml_paths.get(pkg)
+                if yaml_path is None:
+                    _, yaml_path = self._match_yaml(pkg)
+                    if yaml_path is None:
+                        continue
+                if yaml_path not in self.yaml_deps:
+                    paths.add(yaml_path)
+        return sorted(paths)
 
-            if not deps:
-                print(f" Leaf: {pkg}")
-            else:
-                # Recursion occurs immediately (depth-first)
-                self.generate_subgraph(f"{pkg}.dep", prio, depth + 1, qual)
+    # -------------------------------------------------------
+    def write_dep_files(self):
+        """
+        Flush the .dep texts that changed in memory to the dep directory.
+        Each text goes to a temporary file that is renamed over the .dep,
+        so an interrupted run never leaves a half-written node behind.
+        """
+        for path in sorted(self.unwritten):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as depf:
+                depf.write(self.dep_texts[path])
+            os.replace(tmp_path, path)
+        self.unwritten.clear()
 
     # -------------------------------------------------------
     def clean_subgraph(self):
@@ -239,207 +374,284 @@ class DepSolver:
           - Loop 1: remove dangling edges
           - Loop 2: handle 'after' edges (create groupxx nodes)
           - Loop 3: handle 'first' edges (create -pass1 nodes)
-        """
 
-        import re
+        Works on self.dep_texts (loaded from the dep directory when the
+        graph was not generated in this process) and writes the files it
+        changed once at the end.
+        """
 
-        dep_files = sorted(
-            f for f in glob.glob(os.path.join(self.dep_dir, "*.dep"))
-            if os.path.basename(f) != "root.dep"
-        )
+        texts = self.dep_texts
+        if not texts:
+            with os.scandir(self.dep_dir) as it:
+                for e in it:
+                    if e.name.endswith(".dep"):
+                        with open(e.path) as f:
+                            texts[e.path] = f.read()
+
+        # Loop 1 neither adds nor removes nodes, so these lists hold for it
+        all_dep_files = sorted(texts)
+        dep_files = [f for f in all_dep_files if os.path.basename(f) != "root.dep"]
+
+        prefix = self.dep_prefix
+        cut = len(prefix)
+        root_path = f"{prefix}root.dep"
+
+        # A line's qualifier is a whole middle token, so a text holding no
+        # whitespace-delimited "a" (or "f") has no such edge to process
+        has_after = re.compile(r"\sa\s").search
+        has_first = re.compile(r"\sf\s").search
+        # Reverse links (filled in by Loop 1, kept current by write_text):
+        # dep name -> .dep paths with an edge line to it. Loop 2 takes a
+        # node's parents from it and Loop 3 its orphan check.
+        targets_of = {}
+        linkers = {}
+
+        def index_text(path):
+            old = targets_of.get(path, set())
+            new = {sys.intern(p[2]) for p in map(str.split, texts[path].splitlines()) if len(p) == 3}
+            for d in old - new:
+                linkers[d].discard(path)
+            for d in new - old:
+                linkers.setdefault(d, set()).add(path)
+            targets_of[path] = new
+
+        def retarget(text, old, new):
+            # Point the edge lines whose dep is exactly old at new instead
+            out = []
+            for line in text.splitlines(keepends=True):
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == old:
+                    body = line.rstrip()
+                    line = body[:-len(old)] + new + line[len(body):]
+                out.append(line)
+            return "".join(out)
 
         # --- Loop 1: Remove dangling edges ---
+        # One pass per file: filter its lines, then index the result.
+        existing = {sys.intern(f[cut:-4]) for f in all_dep_files}
         for node in dep_files:
-            lines_to_remove = []
-            with open(node) as f:
-                for line in f:
-                    parts = line.strip().split()
-                    if len(parts) != 3:
-                        continue
-                    _, _, dep = parts
-                    if not os.path.exists(os.path.join(self.dep_dir, f"{dep}.dep")):
-                        lines_to_remove.append(dep)
-
-            if lines_to_remove:
-                content = []
-                with open(node) as f:
-                    for line in f:
-                        if not any(line.strip().endswith(f" {d}") for d in lines_to_remove):
-                            content.append(line)
-                with open(node, "w") as f:
-                    f.writelines(content)
+            lines = texts[node].splitlines(keepends=True)
+            kept = [l for l in lines
+                    if len(parts := l.split()) != 3 or parts[2] in existing]
+            if len(kept) != len(lines):
+                texts[node] = "".join(kept)
+                self.unwritten.add(node)
+            index_text(node)
 
         print("[CLEAN] Removed dangling edges")
 
-        # Helper function for path_to() equivalence
-        def path_to(start, seek, prio, seen=None):
-            if seen is None:
-                seen = set()
-            if start == seek:
-                return True
-            seen.add(start)
-            start_path = os.path.join(self.dep_dir, f"{start}.dep")
-            if not os.path.exists(start_path):
-                return False
-            with open(start_path) as f:
-                for line in f:
-                    parts = line.strip().split()
+        # Parsed (prio, dep) edges per node, built lazily from texts
+        adj = {}
+        # path_to memo: (start, prio) -> set of nodes reachable from start
+        reach = {}
+        # reaches memo: (target, prio) -> set of nodes that reach target
+        reach_to = {}
+
+        def invalidate(node, targets=()):
+            # Only reachable sets that contain node can see its edges change.
+            # path_to parses every node it reaches, so a node without parsed
+            # edges is in no reachable set and there is nothing to drop.
+            if adj.pop(node, None) is not None:
+                for key in [k for k, r in reach.items() if node in r]:
+                    del reach[key]
+            # A reaching set can lose node when its edges change, or gain
+            # it when one of its new targets is in the set
+            for key in [k for k, r in reach_to.items() if node in r or not r.isdisjoint(targets)]:
+                del reach_to[key]
+
+        def write_text(path, content):
+            if texts.get(path) == content:
+                return  # unchanged; keep it clean and its edges cached
+            texts[path] = content
+            self.unwritten.add(path)
+            if path != root_path:
+                index_text(path)
+            invalidate(path[cut:-4], targets_of.get(path, ()))
+
+        def edges_of(node):
+            if node not in adj:
+                edges = []
+                for line in texts.get(f"{prefix}{node}.dep", "").splitlines():
+                    parts = line.split()
                     if len(parts) != 3:
                         continue
                     p, _, dep = parts
                     try:
-                        p = int(p)
+                        edges.append((int(p), sys.intern(dep)))
                     except ValueError:
                         continue
-                    if p > prio or dep in seen:
-                        continue
-                    if path_to(dep, seek, prio, seen):
-                        return True
-            return False
+                adj[node] = edges
+            return adj[node]
+
+        # Helper function for path_to() equivalence
+        def path_to(start, seek, prio):
+            seen = reach.get((start, prio))
+            if seen is None:
+                stack = [start]
+                seen = {start}
+                while stack:
+                    node = stack.pop()
+                    for p, dep in edges_of(node):
+                        if p <= prio and dep not in seen:
+                            seen.add(dep)
+                            stack.append(dep)
+                reach[(start, prio)] = seen
+            return seek in seen
+
+        # path_to(start, target, prio) from the other end: one reverse walk
+        # over linkers per (target, prio) answers it for every start
+        def reaches(start, target, prio):
+            seen = reach_to.get((target, prio))
+            if seen is None:
+                stack = [target]
+                seen = {target}
+                while stack:
+                    node = stack.pop()
+                    for parent_path in linkers.get(node, ()):
+                        parent = sys.intern(parent_path[cut:-4])
+                        if parent not in seen and any(
+                            p <= prio and dep == node for p, dep in edges_of(parent)
+                        ):
+                            seen.add(parent)
+                            stack.append(parent)
+                reach_to[(target, prio)] = seen
+            return start in seen
+
+        def append_root(node):
+            texts[root_path] = texts.get(root_path, "") + f"1 b {node}\n"
+            invalidate("root", (node,))
+            self.unwritten.add(root_path)
 
         # --- Loop 2: Process 'after' edges ---
         for node_path in dep_files:
             node = os.path.basename(node_path)
-            if node == "root.dep":
+            if node == "root.dep" or not has_after(texts[node_path]):
                 continue
-            with open(node_path) as f:
-                lines = [l.strip() for l in f if l.strip()]
+            lines = [l for l in map(str.strip, texts[node_path].splitlines()) if l]
+            parsed = [l.split() for l in lines]
 
-            after_edges = [l for l in lines if re.search(r"\sa\s", l)]
+            # Qualifier compared as a token, not a ' a ' substring
+            is_after = [len(p) == 3 and p[1] == "a" for p in parsed]
+            after_edges = [p for p, a in zip(parsed, is_after) if a]
             if not after_edges:
                 continue
 
             node_base = node[:-4]
             group_node = f"{node_base}groupxx"
-            group_path = os.path.join(self.dep_dir, f"{group_node}.dep")
+            group_path = f"{prefix}{group_node}.dep"
 
             b_flag = 0  # nothing depends on groupxx yet
 
-            # find parents that depend on this node
-            all_files = sorted(glob.glob(os.path.join(self.dep_dir, "*.dep")))
-            for parent_path in all_files:
+            # direct parents: nodes with an edge to exactly this node
+            for parent_path in sorted(linkers.get(node_base, ())):
                 parent = os.path.basename(parent_path)
-                if parent == "root.dep":
-                    continue
-                with open(parent_path) as f:
-                    parent_content = f.read()
-
-                # only consider direct parents
-                if not re.search(rf"\b{re.escape(node_base)}\b", parent_content):
-                    continue
+                parent_content = texts[parent_path]
 
                 p_flag = 0  # no after dependency depends on parent yet
-                for line in after_edges:
-                    _, _, dep = line.split()
+                for _, _, dep in after_edges:
                     if path_to(dep, parent[:-4], 3):
                         p_flag = 1
                         break
 
                 if p_flag == 0:
                     b_flag = 1
-                    new_content = re.sub(
-                        rf"\b{re.escape(node_base)}\b", f"{node_base}groupxx", parent_content
-                    )
-                    with open(parent_path, "w") as f:
-                        f.write(new_content)
+                    new_content = retarget(parent_content, node_base, group_node)
+                    if new_content != parent_content:
+                        write_text(parent_path, new_content)
 
             # Write the groupxx node itself
-            with open(group_path, "w") as f:
-                f.write(f"1 b {node_base}\n")
-                for line in after_edges:
-                    prio, _, dep = line.split()
-                    f.write(f"{prio} b {dep}\n")
+            group_lines = [f"1 b {node_base}\n"]
+            for prio, _, dep in after_edges:
+                group_lines.append(f"{prio} b {dep}\n")
+            write_text(group_path, "".join(group_lines))
 
             if b_flag == 0:
-                with open(os.path.join(self.dep_dir, "root.dep"), "a") as f:
-                    f.write(f"1 b {group_node}\n")
+                append_root(group_node)
 
             # Remove 'after' edges from original node
-            new_lines = [l for l in lines if not re.search(r"\sa\s", l)]
-            with open(node_path, "w") as f:
-                f.write("\n".join(new_lines) + "\n")
+            new_lines = [l for l, a in zip(lines, is_after) if not a]
+            write_text(node_path, "\n".join(new_lines) + "\n")
 
             print(f"[GROUP] Created {group_node}.dep")
 
         print("[CLEAN] Processed 'after' edges")
 
         # --- Loop 3: Process 'first' edges ---
+        dep_file_set = set(dep_files)
         for node_path in dep_files:
+            if not has_first(texts[node_path]):
+                continue
             node = os.path.basename(node_path)
-            with open(node_path) as f:
-                lines = [l.strip() for l in f if l.strip()]
+            lines = [l for l in map(str.strip, texts[node_path].splitlines()) if l]
 
-            first_edges = [l for l in lines if re.search(r"\sf\s", l)]
+            first_edges = [p for p in map(str.split, lines) if len(p) == 3 and p[1] == "f"]
             if not first_edges:
                 continue
 
             node_base = node[:-4]
             lines_to_change = []
 
-            for line in first_edges:
-                _, _, dep = line.split()
-                src = os.path.join(self.dep_dir, f"{dep}.dep")
-                pass1 = os.path.join(self.dep_dir, f"{dep}-pass1.dep")
+            for _, _, dep in first_edges:
+                src = f"{prefix}{dep}.dep"
+                pass1 = f"{prefix}{dep}-pass1.dep"
 
                 # Copy original dep file
-                if os.path.exists(src):
-                    with open(src) as f:
-                        dep_lines = f.readlines()
-                    with open(pass1, "w") as f:
-                        f.writelines(dep_lines)
+                if src in texts:
+                    write_text(pass1, texts[src])
                     print(f"[PASS1] Created {dep}-pass1.dep")
 
                 # remove any circular chain deps
                 lr = []
-                if os.path.exists(pass1):
-                    with open(pass1) as f:
-                        for p_line in f:
-                            parts = p_line.strip().split()
-                            if len(parts) != 3:
-                                continue
-                            p, _, start = parts
-                            if path_to(start, node_base, int(p)):
-                                lr.append(start)
+                if pass1 in texts:
+                    pass1_lines = texts[pass1].splitlines(keepends=True)
+                    for p_line in pass1_lines:
+                        parts = p_line.split()
+                        if len(parts) != 3:
+                            continue
+                        p, _, start = parts
+                        if reaches(start, node_base, int(p)):
+                            lr.append(start)
                     if lr:
-                        with open(pass1) as f:
-                            dep_lines = [
-                                d for d in f if not any(d.strip().endswith(f" {x}") for x in lr)
-                            ]
-                        with open(pass1, "w") as f:
-                            f.writelines(dep_lines)
+                        ends = tuple(f" {x}" for x in lr)
+                        dep_lines = [d for d in pass1_lines if not d.strip().endswith(ends)]
+                        write_text(pass1, "".join(dep_lines))
 
                 lines_to_change.append(dep)
 
             # rewrite references in node file
             for dep in lines_to_change:
                 lines = [
-                    re.sub(rf"[0-9]+\sf\s{dep}$", f"1 b {dep}-pass1", l) for l in lines
+                    f"1 b {dep}-pass1" if l.split()[1:] == ["f", dep] else l for l in lines
                 ]
-                # check if orphan
-                linked = False
-                for other in dep_files:
-                    if other == node_path:
-                        continue
-                    if dep in open(other).read():
-                        linked = True
-                        break
+                # check if orphan: no other original node mentions dep. An
+                # exact edge settles it; otherwise fall back to the substring
+                # test, which also counts e.g. "dep-pass1" or "depgroupxx"
+                linked = any(
+                    other != node_path and other in dep_file_set
+                    for other in linkers.get(dep, ())
+                ) or any(dep in texts[other] for other in dep_files if other != node_path)
                 if not linked:
-                    with open(os.path.join(self.dep_dir, "root.dep"), "a") as f:
-                        f.write(f"1 b {dep}\n")
+                    append_root(dep)
 
-            with open(node_path, "w") as f:
-                f.write("\n".join(lines) + "\n")
+            write_text(node_path, "\n".join(lines) + "\n")
 
         print("[CLEAN] Processed 'first' edges")
 
+        self.write_dep_files()
+
 
 
     # -------------------------------------------------------
     def run_pipeline(self, packages: list[str]):
         """Run Steps 2 - 4: generate deps, expand graph, clean it."""
         root_path = self.generate_deps(packages)
-        self.generate_subgraph(os.path.basename(root_path), 1, 1, "b")
-        self.clean_subgraph()
+        try:
+            # Generated texts are written once, after cleaning; if a step
+            # stops early, whatever was built so far still reaches disk
+            self.generate_subgraph(os.path.basename(root_path), 1, 1, "b", flush=False)
+            self.clean_subgraph()
+        finally:
+            self.write_dep_files()
         print("[PIPELINE] Step 4 complete â€” graph ready for tree generation.")
 
 
@@ -1,9 +1,34 @@
+import os
+import sys
 import argparse
-import yaml
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import networkx as nx
 
+# YAML loading and the on-disk parse cache are shared with the current
+# builder (builder/skwscript)
+sys.path.append(str(Path(__file__).resolve().parents[4] / "builder"))
+from skwscript.yamlio import (
+    PARALLEL_LOAD_MIN, load_dependencies, read_stat_cache, stale_keys, write_stat_cache,
+)
+
+# Parsed YAML kept in yaml_dir as {filename: (mtime_ns, size, data)}
+YAML_CACHE_NAME = ".skw_parse_cache"
+
+
+def _parse_yaml(path):
+    """Parse one package YAML file (module level so pool workers can run it)."""
+    return load_dependencies(Path(path).read_bytes())
+
+
 class SKWDepSolver:
+    # Fixed attribute set; slots keep the per-edge attribute reads cheap
+    __slots__ = (
+        "yaml_dir", "output_dir", "packages", "classes", "graph", "weight_map",
+        "visited", "parsed", "parse_cache", "debug", "yaml_stems", "yaml_prefixed",
+        "class_weights",
+    )
+
     def __init__(self, yaml_dir, output_dir="dependencies", packages=None, classes=None, debug=False):
         self.yaml_dir = Path(yaml_dir)
         self.output_dir = Path(output_dir)
@@ -11,163 +36,481 @@ class SKWDepSolver:
         self.classes = set(classes or ["required", "recommended", "optional"])
         self.graph = nx.DiGraph()
         self.weight_map = {"required": 1, "recommended": 2, "optional": 3}
+        # (class, weight) pairs walked for every parsed YAML
+        self.class_weights = tuple((c, self.weight_map.get(c, 3)) for c in self.classes)
         self.visited = set()
+        self.parsed = {}
+        self.parse_cache = None
         self.debug = debug
+        self.yaml_stems, self.yaml_prefixed = self._index_yaml_dir()
 
     def _log(self, message):
         if self.debug:
             print(f"[DEBUG] {message}")
 
+    def _index_yaml_dir(self):
+        """
+        Scan yaml_dir once. Returns the set of YAML stems and a map from every
+        '<prefix>-' a stem starts with to the lowest-sorting file name under
+        it, which is what sorted(glob('<pkg>-*.yaml'))[0] picked.
+        """
+        stems = set()
+        prefixed = {}
+        with os.scandir(self.yaml_dir) as it:
+            for entry in it:
+                name = entry.name
+                if not name.endswith(".yaml"):
+                    continue
+                stem = name[:-5]
+                stems.add(stem)
+                i = stem.find("-")
+                while i != -1:
+                    prefix = stem[:i]
+                    best = prefixed.get(prefix)
+                    if best is None or name < best:
+                        prefixed[prefix] = name
+                    i = stem.find("-", i + 1)
+        return stems, prefixed
+
     def _find_yaml_file(self, pkg_name):
-        exact = self.yaml_dir / f"{pkg_name}.yaml"
-        if exact.exists():
-            return exact
+        if pkg_name in self.yaml_stems:
+            return self.yaml_dir / f"{pkg_name}.yaml"
 
-        matches = sorted(self.yaml_dir.glob(f"{pkg_name}-*.yaml"))
-        if matches:
-            self._log(f"Matched versioned YAML for {pkg_name}: {matches[0].name}")
-            return matches[0]
+        match = self.yaml_prefixed.get(pkg_name)
+        if match:
+            self._log(f"Matched versioned YAML for {pkg_name}: {match}")
+            return self.yaml_dir / match
 
         self._log(f"No YAML found for {pkg_name}")
         return None
 
-    def _load_package_yaml(self, pkg_name):
-        yaml_file = self._find_yaml_file(pkg_name)
-        if not yaml_file or pkg_name in self.visited:
+    def _parse_closure(self, roots):
+        """
+        Parse the YAML of every package reachable from roots into self.parsed
+        as {name: (yaml_file, edges)}, or None when no YAML exists. Discovery
+        runs wave by wave; a wave large enough is parsed on a process pool.
+        Files whose mtime and size match the on-disk cache are not parsed.
+        """
+        if self.parse_cache is None:
+            self.parse_cache = self._read_parse_cache()
+        cache = self.parse_cache
+        dirty = False
+
+        frontier = list(roots)
+        pool = None
+        try:
+            while frontier:
+                wave = {}
+                for name in frontier:
+                    if name in self.parsed or name in wave:
+                        continue
+                    yaml_file = self._find_yaml_file(name)
+                    if yaml_file:
+                        wave[name] = yaml_file
+                    else:
+                        self.parsed[name] = None
+
+                by_file = {yaml_file.name: yaml_file for yaml_file in wave.values()}
+                stamps, stale = stale_keys(cache, by_file)
+
+                paths = [by_file[fname] for fname in stale]
+                if len(paths) < PARALLEL_LOAD_MIN:
+                    results = [_parse_yaml(path) for path in paths]
+                else:
+                    if pool is None:
+                        pool = ProcessPoolExecutor()
+                    results = list(pool.map(_parse_yaml, paths, chunksize=32))
+                results = dict(zip(stale, results))
+
+                frontier = []
+                for name, yaml_file in wave.items():
+                    fname = yaml_file.name
+                    if fname in results:
+                        data = results[fname]
+                        cache[fname] = (*stamps[fname], data)
+                        dirty = True
+                    else:
+                        data = cache[fname][2]
+                    edges = self._edges_from(data)
+                    self.parsed[name] = (yaml_file, edges)
+                    frontier.extend(dep for dep, _, _ in edges)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if dirty:
+            self._write_parse_cache(cache)
+
+    def _read_parse_cache(self):
+        """Load the parse cache, dropping entries for YAML files that are gone."""
+        cache = read_stat_cache(self.yaml_dir / YAML_CACHE_NAME)
+        return {k: v for k, v in cache.items() if k[:-5] in self.yaml_stems}
+
+    def _write_parse_cache(self, cache):
+        write_stat_cache(self.yaml_dir / YAML_CACHE_NAME, cache)
+
+    def _load_package_yaml(self, *pkg_names):
+        self._parse_closure(pkg_names)
+
+        # Depth-first over an explicit stack of per-package edge iterators;
+        # packages are entered in the same order the recursive loader used.
+        # Edges from every root are collected in that order and added in
+        # one batch. networkx copies edge attributes into its own dict, so
+        # each (weight, qualifier) pair needs just one attribute dict here.
+        new_edges = []
+        add_edge = new_edges.append
+        attr_dicts = {}
+        package_edges = self._package_edges
+        debug = self.debug
+        for pkg_name in pkg_names:
+            edges = package_edges(pkg_name)
+            if not edges:
+                continue
+            stack = [(pkg_name, iter(edges))]
+
+            while stack:
+                pkg, pending = stack[-1]
+                edge = next(pending, None)
+                if edge is None:
+                    stack.pop()
+                    continue
+
+                dep, qualifier, weight = edge
+                attrs = attr_dicts.get((weight, qualifier))
+                if attrs is None:
+                    attrs = attr_dicts[(weight, qualifier)] = {"weight": weight, "qualifier": qualifier}
+                add_edge((pkg, dep, attrs))
+                if debug:
+                    self._log(f"Edge added: {pkg} -> {dep} ({qualifier}, weight={weight})")
+                edges = package_edges(dep)
+                if edges:
+                    stack.append((dep, iter(edges)))
+
+        self.graph.add_edges_from(new_edges)
+
+    def _package_edges(self, pkg_name):
+        """Mark pkg_name visited and return its (dep, qualifier, weight) edges."""
+        entry = self.parsed.get(pkg_name)
+        if pkg_name in self.visited or entry is None:
             self._log(f"Skipping {pkg_name} (already visited or missing YAML)")
-            return
+            return None
 
         self.visited.add(pkg_name)
+        yaml_file, edges = entry
         self._log(f"Loading {pkg_name} from {yaml_file}")
 
-        with open(yaml_file, "r", encoding="utf-8") as f:
-            data = yaml.safe_load(f)
-
+        if not edges:
+            self._log(f"No dependencies for {pkg_name}")
+            return None
+        return edges
+
+    def _edges_from(self, data):
+        """
+        Return the (dep, qualifier, weight) edges declared in parsed YAML,
+        one per dep. A dep named by several classes keeps its strongest
+        (lowest) weight, at the position it was first named.
+        """
         deps = data.get("dependencies", {})
         if not deps:
-            self._log(f"No dependencies for {pkg_name}")
-            return
-
-        for dep_type in self.classes:
-            group = deps.get(dep_type, {})
+            return []
 
-            if isinstance(group, list):
-                deps_iter = group
-            else:
-                deps_iter = []
-                for order in ["first", "before", "after"]:
-                    values = group.get(order, []) if isinstance(group, dict) else []
-                    if isinstance(values, str):
-                        values = [values]
-                    deps_iter.extend([(v, order) for v in values])
-
-            for item in deps_iter:
-                if isinstance(item, tuple):
-                    dep, qualifier = item
-                else:
-                    dep, qualifier = item, "before"
+        edges = {}
+        for dep_type, weight in self.class_weights:
+            for dep, qualifier in self._iter_deps(deps.get(dep_type)):
                 if dep:
-                    weight = self.weight_map.get(dep_type, 3)
-                    self.graph.add_edge(pkg_name, dep, weight=weight, qualifier=qualifier)
-                    self._log(f"Edge added: {pkg_name} -> {dep} ({qualifier}, weight={weight})")
-                    self._load_package_yaml(dep)
+                    seen = edges.get(dep)
+                    if seen is None or weight <= seen[1]:
+                        edges[dep] = (qualifier, weight)
+        return [(dep, qualifier, weight) for dep, (qualifier, weight) in edges.items()]
+
+    @staticmethod
+    def _iter_deps(group):
+        """
+        Yield (dep, qualifier) from one dependency class: either a plain
+        list (all "before") or a mapping of first/before/after to a name or
+        a list of names.
+        """
+        if not group:
+            return
+        if isinstance(group, list):
+            for dep in group:
+                yield dep, "before"
+            return
+        if not isinstance(group, dict):
+            return
+        for order in ("first", "before", "after"):
+            values = group.get(order)
+            if not values:
+                continue
+            if isinstance(values, str):
+                yield values, order
+            else:
+                for dep in values:
+                    yield dep, order
 
     def load_yaml_files(self):
-        for pkg in (self.packages or []):
-            self._load_package_yaml(pkg)
+        self._load_package_yaml(*(self.packages or []))
 
     def handle_after_edges(self):
-        after_edges = [(u, v) for u, v, d in self.graph.edges(data=True) if d.get("qualifier") == "after"]
+        graph = self.graph
+        succ, pred = graph.adj, graph.pred
+        after_edges = [(u, v) for u, v, q in graph.edges(data="qualifier") if q == "after"]
 
         for u, v in after_edges:
             group_node = f"{v}-groupxx"
 
-            if group_node not in self.graph:
-                self.graph.add_node(group_node)
-
-            for pred in list(self.graph.predecessors(u)):
-                if pred != group_node:
-                    self.graph.add_edge(pred, group_node, weight=1)
+            if group_node not in graph:
+                graph.add_node(group_node)
 
-            self.graph.add_edge(group_node, v, weight=1)
+            # Snapshot both neighbour lists before the batched inserts
+            parents = [p for p in pred[u] if p != group_node]
+            graph.add_edges_from([(p, group_node) for p in parents], weight=1)
 
-            for child in list(self.graph.successors(v)):
-                if child != group_node:
-                    self.graph.add_edge(group_node, child, weight=self.graph[v][child].get("weight", 1))
+            graph.add_edge(group_node, v, weight=1)
 
-            self.graph.remove_edge(u, v)
+            graph.add_edges_from([
+                (group_node, child, {"weight": attrs.get("weight", 1)})
+                for child, attrs in succ[v].items()
+                if child != group_node
+            ])
 
-    def detect_and_resolve_cycles(self):
-        cycles = list(nx.simple_cycles(self.graph))
-        resolved = []
+            graph.remove_edge(u, v)
 
-        for cycle in sorted(cycles, key=lambda c: tuple(sorted(c))):
-            if len(cycle) < 2:
-                continue
+    def _strongly_connected_components(self, roots=None):
+        """Iterative Tarjan; returns every SCC reachable from roots (default: all nodes)."""
+        index, low = {}, {}
+        stack, on_stack = [], set()
+        sccs = []
+        succ = self.graph.adj
 
-            cycle = sorted(cycle)
-            edges = [(cycle[i], cycle[(i + 1) % len(cycle)]) for i in range(len(cycle))]
-            existing_edges = [(u, v) for (u, v) in edges if self.graph.has_edge(u, v)]
-            if not existing_edges:
+        for root in (self.graph if roots is None else roots):
+            if root in index:
                 continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(succ[root]))]
+            while work:
+                node, it = work[-1]
+                for nxt in it:
+                    if nxt not in index:
+                        index[nxt] = low[nxt] = len(index)
+                        stack.append(nxt)
+                        on_stack.add(nxt)
+                        work.append((nxt, iter(succ[nxt])))
+                        break
+                    if nxt in on_stack:
+                        low[node] = min(low[node], index[nxt])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == index[node]:
+                        scc = []
+                        while True:
+                            w = stack.pop()
+                            on_stack.discard(w)
+                            scc.append(w)
+                            if w == node:
+                                break
+                        sccs.append(scc)
+        return sccs
 
-            weights = [self.graph[u][v].get("weight", 3) for u, v in existing_edges]
-            all_required = all(w == 1 for w in weights)
-
-            if all_required:
-                first = cycle[0]
-                new_node = f"{first}-pass1"
-                print(f"[CYCLE] Breaking required cycle {cycle} by adding {new_node}")
+    def detect_and_resolve_cycles(self):
+        # Break one cycle at a time, in nx.find_cycle order, instead of
+        # enumerating every simple cycle, which is exponential on dense
+        # graphs. Cycles only exist inside SCCs and breaking one never
+        # creates another, so each nontrivial SCC is worked on until it is
+        # acyclic. Self-loops are left alone, as before.
+        # Kahn peels off every node that cannot be on a cycle. An acyclic
+        # graph (the usual case) is done right there; otherwise only the
+        # leftover core, which has no edges back out to peeled nodes,
+        # needs the SCC pass.
+        _, indegree = self._kahn()
+        core = [n for n, d in indegree.items() if d]
+        if not core:
+            return []
 
-                self.graph.add_node(new_node)
-                for pred in list(self.graph.predecessors(first)):
-                    if pred not in cycle:
-                        self.graph.add_edge(pred, new_node, weight=1)
-                resolved.append((cycle, new_node))
+        resolved = []
+        for scc in self._strongly_connected_components(core):
+            if len(scc) < 2:
+                continue
+            # Number the SCC's members once and keep successor lists of
+            # ints, so the repeated cycle searches below never go through
+            # networkx views. Node and edge order match the subgraph, and
+            # self-loops are left out.
+            sub = self.graph.subgraph(scc)
+            names = list(sub)
+            ids = {n: i for i, n in enumerate(names)}
+            succ = [[ids[v] for v in sub.adj[u] if v != u] for u in names]
+
+            while True:
+                found = self._first_cycle(succ)
+                if found is None:
+                    break
+                resolved.append(self._break_cycle(
+                    [(names[u], names[v]) for u, v in found]
+                ))
+                for u, v in found:
+                    if not self.graph.has_edge(names[u], names[v]):
+                        succ[u].remove(v)
+        return resolved
 
-                u, v = existing_edges[0]
-                if self.graph.has_edge(u, v):
-                    self.graph.remove_edge(u, v)
-            else:
-                weakest = max(existing_edges, key=lambda e: self.graph[e[0]][e[1]].get("weight", 3))
-                u, v = weakest
-                if self.graph.has_edge(u, v):
-                    w = self.graph[u][v]["weight"]
-                    print(f"[CYCLE] Dropping weaker edge {u} -> {v} (weight={w}) from cycle {cycle}")
-                    self.graph.remove_edge(u, v)
-                    resolved.append((cycle, f"dropped {u}->{v}"))
+    @staticmethod
+    def _first_cycle(succ):
+        """
+        The cycle nx.find_cycle would report on int successor lists, as
+        (u, v) pairs, or None. Finished nodes are never walked again, so
+        unlike find_cycle this stays linear on an acyclic graph.
+        """
+        WHITE, GREY, BLACK = 0, 1, 2
+        color = [WHITE] * len(succ)
+
+        for root in range(len(succ)):
+            if color[root] != WHITE:
+                continue
+            color[root] = GREY
+            path = [root]
+            stack = [iter(succ[root])]
+            while stack:
+                nxt = next(stack[-1], None)
+                if nxt is None:
+                    color[path.pop()] = BLACK
+                    stack.pop()
+                    continue
+                state = color[nxt]
+                if state == GREY:
+                    cycle = path[path.index(nxt):]
+                    return list(zip(cycle, cycle[1:] + [nxt]))
+                if state == WHITE:
+                    color[nxt] = GREY
+                    path.append(nxt)
+                    stack.append(iter(succ[nxt]))
+        return None
 
-        return resolved
+    def _break_cycle(self, cycle_edges):
+        # Every member leaves the cycle by exactly one edge, so this map is
+        # both the member set and the edge lookup; sorted once for output.
+        next_in_cycle = dict(cycle_edges)
+        cycle = sorted(next_in_cycle)
+        # Look each cycle edge's weight up once and reuse it below
+        weights = {(u, v): self.graph[u][v].get("weight", 3) for u, v in cycle_edges}
+
+        if all(w == 1 for w in weights.values()):
+            first = cycle[0]
+            new_node = f"{first}-pass1"
+            print(f"[CYCLE] Breaking required cycle {cycle} by adding {new_node}")
+
+            self.graph.add_node(new_node)
+            self.graph.add_edges_from(
+                [(pred, new_node) for pred, _ in self.graph.in_edges(first)
+                 if pred not in next_in_cycle],
+                weight=1,
+            )
+
+            # Cut the cycle at the edge leaving first
+            self.graph.remove_edge(first, next_in_cycle[first])
+            return (cycle, new_node)
+
+        u, v = max(weights, key=weights.get)
+        w = weights[(u, v)]
+        print(f"[CYCLE] Dropping weaker edge {u} -> {v} (weight={w}) from cycle {cycle}")
+        self.graph.remove_edge(u, v)
+        return (cycle, f"dropped {u}->{v}")
+
+    def _kahn(self):
+        """
+        Kahn's algorithm straight over the adjacency dicts. Returns the
+        emitted order and the final in-degrees; nodes left with a nonzero
+        in-degree are on, or downstream of, a cycle.
+        """
+        indegree = dict(self.graph.in_degree())
+        succ = self.graph.adj
+
+        # The order list doubles as the FIFO queue: iteration picks up
+        # nodes appended while it runs.
+        order = [n for n, d in indegree.items() if not d]
+        emit = order.append
+        for n in order:
+            for m in succ[n]:
+                d = indegree[m] - 1
+                indegree[m] = d
+                if not d:
+                    emit(m)
+        return order, indegree
 
     def topological_sort(self):
-        try:
-            return list(nx.topological_sort(self.graph))
-        except nx.NetworkXUnfeasible:
+        # graphlib's TopologicalSorter is pure Python and measured slower
+        # than the plain Kahn pass in _kahn.
+        order, indegree = self._kahn()
+
+        if len(order) != len(indegree):
+            # Only nodes Kahn could not emit can lie on a cycle
+            remaining = [n for n, d in indegree.items() if d]
             print("[ERROR] Graph still contains cycles!")
             print("[DEBUG] Remaining cycles:")
-            for c in nx.simple_cycles(self.graph):
+            for c in self._find_cycles(remaining):
                 print("   ", " → ".join(c))
             return []
+        return order
+
+    def _find_cycles(self, nodes):
+        """Iterative white/grey/black DFS restricted to nodes; one cycle per back edge."""
+        WHITE, GREY, BLACK = 0, 1, 2
+        color = dict.fromkeys(nodes, WHITE)
+        cycles = []
+        succ = self.graph.adj
+
+        for root in nodes:
+            if color[root] != WHITE:
+                continue
+            color[root] = GREY
+            path = [root]
+            stack = [iter(succ[root])]
+            while stack:
+                nxt = next(stack[-1], None)
+                if nxt is None:
+                    color[path.pop()] = BLACK
+                    stack.pop()
+                    continue
+                state = color.get(nxt)
+                if state == GREY:
+                    cycles.append(path[path.index(nxt):])
+                elif state == WHITE:
+                    color[nxt] = GREY
+                    path.append(nxt)
+                    stack.append(iter(succ[nxt]))
+        return cycles
 
     def filter_synthetic_nodes(self, build_order):
         """Remove groupxx and redundant -pass1 nodes from the final build list."""
         filtered = []
+        built = set(build_order)
         for pkg in build_order:
             if pkg.endswith("groupxx"):
                 continue
-            if pkg.endswith("-pass1") and pkg[:-6] in build_order:
+            if pkg.endswith("-pass1") and pkg[:-6] in built:
                 continue
             filtered.append(pkg)
         return filtered
 
     def write_dep_files(self):
         self.output_dir.mkdir(exist_ok=True)
-        for pkg in self.graph.nodes:
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        lines = {pkg: [] for pkg in self.graph}
+        for pkg, dep, w in self.graph.edges(data="weight", default=3):
+            lines[pkg].append(f"{w} b {dep}\n")
+
+        for pkg, pkg_lines in lines.items():
             out_file = self.output_dir / f"{pkg}.dep"
-            with open(out_file, "w", encoding="utf-8") as f:
-                for dep in self.graph.successors(pkg):
-                    weight = self.graph[pkg][dep].get("weight", 3)
-                    f.write(f"{weight} b {dep}\n")
+            body = "".join(pkg_lines).encode("utf-8")
+            # One open/write/close per package, no buffered file object
+            fd = os.open(out_file, flags, 0o666)
+            try:
+                os.write(fd, body)
+            finally:
+                os.close(fd)
 
     @classmethod
     def cli(cls):
@@ -196,8 +539,7 @@ class SKWDepSolver:
 
         if args.show_order and order:
             print("\nTopological Build Order:")
-            for pkg in order:
-                print(pkg)
+            print("\n".join(order))
 
 if __name__ == "__main__":
     SKWDepSolver.cli()
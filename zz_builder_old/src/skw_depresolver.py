@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from itertools import chain
 
 @dataclass
 class ParsedEntry:
@@ -49,27 +50,45 @@ class SKWDepResolver:
                          build_queue: list[str],
                          visited: set[str],
                          stack: list[str]) -> None:
-        """Depth-first resolution of one package and its dependencies."""
-        if pkg_id in visited:
-            return
-        if pkg_id in stack:
-            cycle_start = stack.index(pkg_id)
-            cycle_path = stack[cycle_start:] + [pkg_id]
-            raise RuntimeError("Dependency cycle detected: " + " -> ".join(cycle_path))
+        """
+        Depth-first resolution of one package and its dependencies.
+        Runs on an explicit stack of dependency iterators rather than by
+        recursion, so long dependency chains cannot hit the recursion limit.
+        """
+        on_stack = set(stack)
+        pending = []  # one dependency iterator per package on the stack
+        done = object()
 
-        stack.append(pkg_id)
-        entry = self.parsed_entries.get(pkg_id)
-        if not entry:
-            self.warnings.append(f"Unknown package '{pkg_id}'; skipping.")
-            stack.pop()
-            return
+        def enter(pid: str) -> None:
+            if pid in visited:
+                return
+            if pid in on_stack:
+                cycle_start = stack.index(pid)
+                cycle_path = stack[cycle_start:] + [pid]
+                raise RuntimeError("Dependency cycle detected: " + " -> ".join(cycle_path))
 
-        # Walk dependencies in strict priority order
-        for dep_class in self.PRIORITY_ORDER:
-            for dep in entry.dependencies.get(dep_class, []):
-                self._resolve_package(dep, build_queue, visited, stack)
+            entry = self.parsed_entries.get(pid)
+            if not entry:
+                self.warnings.append(f"Unknown package '{pid}'; skipping.")
+                return
 
-        # Finished with all deps ? add package to build queue
-        build_queue.append(pkg_id)
-        visited.add(pkg_id)
-        stack.pop()
+            stack.append(pid)
+            on_stack.add(pid)
+            # Walk dependencies in strict priority order
+            pending.append(chain.from_iterable(
+                entry.dependencies.get(dep_class, []) for dep_class in self.PRIORITY_ORDER
+            ))
+
+        enter(pkg_id)
+        while pending:
+            dep = next(pending[-1], done)
+            if dep is not done:
+                enter(dep)
+                continue
+
+            # Finished with all deps ? add package to build queue
+            pending.pop()
+            finished = stack.pop()
+            on_stack.discard(finished)
+            build_queue.append(finished)
+            visited.add(finished)